@@ -32,7 +32,7 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 # OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import time, os, logging
+import time, os, logging, struct, threading
 from . import Logger
 
 LINKTYPE_BLUETOOTH_LE_LL = 251
@@ -74,9 +74,27 @@ globalHeaderString = [
     ((NETWORK >> 24) & 0xFF),
 ]
 
+GLOBAL_HEADER = struct.pack(
+    "<IHHiIII",
+    MAGIC_NUMBER,
+    VERSION_MAJOR,
+    VERSION_MINOR,
+    THISZONE,
+    SIGFIGS,
+    SNAPLEN,
+    NETWORK,
+)
+# Fields: ts_sec, ts_usec, incl_len, orig_len
+PACKET_HEADER = struct.Struct("<IIII")
+
 DEFAULT_CAPTURE_FILE_DIR = Logger.DEFAULT_LOG_FILE_DIR
 DEFAULT_CAPTURE_FILE_NAME = "capture.pcap"
 
+MAX_CAPTURE_FILE_SIZE = 20000000
+# Buffered packets are written when there are this many bytes or this many seconds passed
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+
 
 def get_capture_file_path(capture_file_path=None):
     default_path = os.path.join(DEFAULT_CAPTURE_FILE_DIR, DEFAULT_CAPTURE_FILE_NAME)
@@ -87,37 +105,78 @@ def get_capture_file_path(capture_file_path=None):
     return os.path.abspath(capture_file_path)
 
 
+# Keeps the capture file open and writes packets as raw bytes through a buffer, which is
+# flushed by size or time, either inline or from a background thread (background_flush).
+# The file size is tracked in memory so the rollover does not need to stat the file.
 class CaptureFileHandler:
-    def __init__(self, capture_file_path=None, clear=False):
+    def __init__(
+        self,
+        capture_file_path=None,
+        clear=False,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        background_flush=False,
+    ):
         filename = get_capture_file_path(capture_file_path)
         if not os.path.isdir(os.path.dirname(filename)):
             os.makedirs(os.path.dirname(filename))
         self.filename = filename
         self.backupFilename = self.filename + ".1"
-        if not os.path.isfile(self.filename):
+        self.bufferSize = buffer_size
+        self.flushInterval = flush_interval
+        self._file = None
+        self._size = 0
+        self._buffer = bytearray()
+        self._bufferLock = threading.Lock()
+        self._fileLock = threading.RLock()
+        self._lastFlush = time.time()
+
+        if not os.path.isfile(self.filename) or clear:
             self.startNewFile()
-        elif os.path.getsize(self.filename) > 20000000:
+        elif os.path.getsize(self.filename) > MAX_CAPTURE_FILE_SIZE:
             self.doRollover()
-        if clear:
-            # clear file
-            self.startNewFile()
+        else:
+            self._open()
+
+        self._flushThread = None
+        self._flushRequested = threading.Event()
+        self._closing = False
+        if background_flush:
+            self._flushThread = threading.Thread(target=self._flushWorker)
+            self._flushThread.daemon = True
+            self._flushThread.start()
+
+    def _open(self):
+        self._file = open(self.filename, "ab")
+        self._size = self._file.tell()
 
     def startNewFile(self):
-        with open(self.filename, "wb") as f:
-            f.write(bytes(globalHeaderString))
+        with self._fileLock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.filename, "wb")
+            self._file.write(GLOBAL_HEADER)
+            self._size = len(GLOBAL_HEADER)
 
     def doRollover(self):
-        try:
-            os.remove(self.backupFilename)
-        except:
-            logging.exception("capture file rollover remove backup failed")
-        try:
-            os.rename(self.filename, self.backupFilename)
-            self.startNewFile()
-        except:
-            logging.exception("capture file rollover failed")
+        with self._fileLock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                os.remove(self.backupFilename)
+            except:
+                logging.exception("capture file rollover remove backup failed")
+            try:
+                os.rename(self.filename, self.backupFilename)
+                self.startNewFile()
+            except:
+                logging.exception("capture file rollover failed")
+                if self._file is None:
+                    self._open()
 
     def readLine(self, lineNum):
+        self.flush()
         line = ""
         with open(self.filename, "r") as f:
             f.seek(lineNum)
@@ -125,45 +184,85 @@ class CaptureFileHandler:
         return line
 
     def readAll(self):
+        self.flush()
         text = ""
         with open(self.filename, "r") as f:
             text = f.read()
         return text
 
     def writeString(self, msgString):
-        with open(self.filename, "ab") as f:
-            f.write(msgString.encode("utf-8"))
+        # chr() of each byte, as made by toString
+        self.write(msgString.encode("latin-1"))
+
+    def write(self, data):
+        with self._bufferLock:
+            self._buffer += data
+            buffered = len(self._buffer)
+        if self._flushThread is not None:
+            if buffered >= self.bufferSize:
+                self._flushRequested.set()
+        elif (
+            buffered >= self.bufferSize
+            or time.time() - self._lastFlush >= self.flushInterval
+        ):
+            self.flush()
 
     def writePacket(self, packet):
-        packetList = [packet.boardId] + packet.getList()
-        packetHeader = self.makePacketHeader(len(packetList), packet.time)
-        self.writeString(toString(packetHeader + packetList))
+        packetBytes = packet.getBytes()
+        length = len(packetBytes) + 1
+        self.write(
+            self.makePacketHeaderBytes(length, packet.time)
+            + bytes([packet.boardId])
+            + packetBytes
+        )
 
-    def makePacketHeader(self, length, timestamp):
+    def flush(self):
+        with self._fileLock:
+            with self._bufferLock:
+                data = self._buffer
+                self._buffer = bytearray()
+            self._lastFlush = time.time()
+            if self._file is None:
+                return
+            if data:
+                self._file.write(data)
+                self._size += len(data)
+            self._file.flush()
+            if self._size > MAX_CAPTURE_FILE_SIZE:
+                self.doRollover()
+
+    def _flushWorker(self):
+        while not self._closing:
+            self._flushRequested.wait(self.flushInterval)
+            self._flushRequested.clear()
+            try:
+                self.flush()
+            except:
+                logging.exception("capture file flush failed")
+
+    def close(self):
+        self._closing = True
+        if self._flushThread is not None:
+            self._flushRequested.set()
+            if self._flushThread is not threading.current_thread():
+                self._flushThread.join()
+        with self._fileLock:
+            self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @property
+    def size(self):
+        return self._size + len(self._buffer)
+
+    def makePacketHeaderBytes(self, length, timestamp):
         TS_SEC = int(timestamp)
-        TS_USEC = int((timestamp - int(timestamp)) * 1_000_000)
-        INCL_LENGTH = length
-        ORIG_LENGTH = length
-
-        headerString = [
-            ((TS_SEC >> 0) & 0xFF),
-            ((TS_SEC >> 8) & 0xFF),
-            ((TS_SEC >> 16) & 0xFF),
-            ((TS_SEC >> 24) & 0xFF),
-            ((TS_USEC >> 0) & 0xFF),
-            ((TS_USEC >> 8) & 0xFF),
-            ((TS_USEC >> 16) & 0xFF),
-            ((TS_USEC >> 24) & 0xFF),
-            ((INCL_LENGTH >> 0) & 0xFF),
-            ((INCL_LENGTH >> 8) & 0xFF),
-            ((INCL_LENGTH >> 16) & 0xFF),
-            ((INCL_LENGTH >> 24) & 0xFF),
-            ((ORIG_LENGTH >> 0) & 0xFF),
-            ((ORIG_LENGTH >> 8) & 0xFF),
-            ((ORIG_LENGTH >> 16) & 0xFF),
-            ((ORIG_LENGTH >> 24) & 0xFF),
-        ]
-        return headerString
+        TS_USEC = int((timestamp - TS_SEC) * 1_000_000)
+        return PACKET_HEADER.pack(TS_SEC, TS_USEC, length, length)
+
+    def makePacketHeader(self, length, timestamp):
+        return list(self.makePacketHeaderBytes(length, timestamp))
 
 
 def toString(myList):
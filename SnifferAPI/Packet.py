@@ -33,7 +33,7 @@
 # OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from . import UART, Exceptions, Notifications
-import time, logging, os, sys, serial
+import time, logging, os, sys, serial, collections, re, struct
 
 SLIP_START = 0xAB
 SLIP_END = 0xBC
@@ -69,6 +69,7 @@ SET_ADV_CHANNEL_HOP_SEQ = 0x17
 GO_IDLE = 0xFE
 
 ADV_ACCESS_ADDRESS = [0xD6, 0xBE, 0x89, 0x8E]
+ADV_ACCESS_ADDRESS_BYTES = bytes(ADV_ACCESS_ADDRESS)
 
 SYNCWORD_POS = 0
 PAYLOAD_LEN_POS_V1 = 1
@@ -105,6 +106,74 @@ VALID_ADV_CHANS = [37, 38, 39]
 
 PACKET_COUNTER_CAP = 2 ** 16
 
+SLIP_UNESCAPE = {
+    bytes([SLIP_ESC_START]): bytes([SLIP_START]),
+    bytes([SLIP_ESC_END]): bytes([SLIP_END]),
+    bytes([SLIP_ESC_ESC]): bytes([SLIP_ESC]),
+}
+SLIP_ESCAPE_SEQUENCE = re.compile(bytes([SLIP_ESC]) + b"(.)", re.DOTALL)
+
+
+def _slipUnescapeMatch(match):
+    # Unknown escape sequences are decoded as SLIP_END, same as the byte-wise decoder did
+    return SLIP_UNESCAPE.get(match.group(1), bytes([SLIP_END]))
+
+
+# Decodes SLIP frames from chunks of bytes as they come from the serial port.
+# Frame boundaries are located with bytearray.find and every frame is unescaped in
+# one pass, so the cost is per chunk and per frame instead of per byte.
+class SlipDecoder:
+    def __init__(self):
+        self._buffer = bytearray()
+        self._inFrame = False
+
+    def reset(self):
+        del self._buffer[:]
+        self._inFrame = False
+
+    # Feed a bytes/bytearray chunk, returns a list of complete decoded frames (bytes)
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        pos = 0
+        while True:
+            if not self._inFrame:
+                start = buffer.find(SLIP_START, pos)
+                if start < 0:
+                    # Everything outside of a frame is garbage
+                    pos = len(buffer)
+                    break
+                pos = start + 1
+                self._inFrame = True
+            end = self._findEnd(buffer, pos)
+            if end < 0:
+                break
+            frames.append(self.unescape(buffer[pos:end]))
+            pos = end + 1
+            self._inFrame = False
+        del buffer[:pos]
+        return frames
+
+    @staticmethod
+    def _findEnd(buffer, pos):
+        end = buffer.find(SLIP_END, pos)
+        while end > pos and buffer[end - 1] == SLIP_ESC:
+            # A SLIP_END preceded by an odd number of escapes is escaped itself
+            escapes = 1
+            while end - escapes > pos and buffer[end - escapes - 1] == SLIP_ESC:
+                escapes += 1
+            if escapes % 2 == 0:
+                break
+            end = buffer.find(SLIP_END, end + 1)
+        return end
+
+    @staticmethod
+    def unescape(frame):
+        if SLIP_ESC not in frame:
+            return bytes(frame)
+        return SLIP_ESCAPE_SEQUENCE.sub(_slipUnescapeMatch, bytes(frame))
+
 
 class PacketReader(Notifications.Notifier):
     def __init__(self, portnum=None, callbacks=[], baudrate=None):
@@ -118,6 +187,8 @@ class PacketReader(Notifications.Notifier):
         self.packetCounter = 0
         self.lastReceivedPacketCounter = 0
         self.lastReceivedPacket = None
+        self.slipDecoder = SlipDecoder()
+        self.pendingFrames = collections.deque()
 
         # self.states = {}
 
@@ -149,45 +220,27 @@ class PacketReader(Notifications.Notifier):
         tempSLIPBuffer.append(SLIP_END)
         return tempSLIPBuffer
 
-    # This function uses getSerialByte() function to get SLIP encoded bytes from the serial port and return a decoded byte list
-    # Based on https://github.com/mehdix/pyslip/
+    # This function uses decodeFrameFromSLIP() to get a decoded byte list
     def decodeFromSLIP(self, timeout=None, complete_timeout=None):
-        dataBuffer = []
-        startOfPacket = False
-        endOfPacket = False
+        return list(self.decodeFrameFromSLIP(timeout, complete_timeout))
 
+    # This function uses getSerialChunk() function to get SLIP encoded bytes from the serial port and return a decoded frame (bytes)
+    # Frames are decoded from whole chunks, see SlipDecoder
+    def decodeFrameFromSLIP(self, timeout=None, complete_timeout=None):
         if complete_timeout is not None:
             time_start = time.time()
 
-        while not startOfPacket and (
-            complete_timeout is None or (time.time() - time_start < complete_timeout)
-        ):
-            res = self.getSerialByte(timeout)
-            startOfPacket = res == SLIP_START
-
-        while not endOfPacket and (
-            complete_timeout is None or (time.time() - time_start < complete_timeout)
-        ):
-            serialByte = self.getSerialByte(timeout)
-            if serialByte == SLIP_END:
-                endOfPacket = True
-            elif serialByte == SLIP_ESC:
-                serialByte = self.getSerialByte(timeout)
-                if serialByte == SLIP_ESC_START:
-                    dataBuffer.append(SLIP_START)
-                elif serialByte == SLIP_ESC_END:
-                    dataBuffer.append(SLIP_END)
-                elif serialByte == SLIP_ESC_ESC:
-                    dataBuffer.append(SLIP_ESC)
-                else:
-                    dataBuffer.append(SLIP_END)
-            else:
-                dataBuffer.append(serialByte)
-        if not endOfPacket:
-            raise Exceptions.UARTPacketError(
-                "Exceeded max timeout of %f seconds." % complete_timeout
+        while not self.pendingFrames:
+            if complete_timeout is not None and (
+                time.time() - time_start >= complete_timeout
+            ):
+                raise Exceptions.UARTPacketError(
+                    "Exceeded max timeout of %f seconds." % complete_timeout
+                )
+            self.pendingFrames.extend(
+                self.slipDecoder.feed(self.getSerialChunk(timeout))
             )
-        return dataBuffer
+        return self.pendingFrames.popleft()
 
     # This function read byte chuncks from the serial port and return one byte at a time
     # Based on https://github.com/mehdix/pyslip/
@@ -197,6 +250,15 @@ class PacketReader(Notifications.Notifier):
             raise Exceptions.SnifferTimeout("Packet read timed out.")
         return serialByte
 
+    # This function returns all bytes read from the serial port since the last call
+    def getSerialChunk(self, timeout=None):
+        serialChunk = self.uart.readChunk(timeout)
+        if serialChunk is None:
+            if not self.uart.reading:
+                raise serial.SerialException("UART is no longer reading.")
+            raise Exceptions.SnifferTimeout("Packet read timed out.")
+        return serialChunk
+
     def handlePacketHistory(self, packet):
         # Reads and validates packet counter
         if (
@@ -219,15 +281,14 @@ class PacketReader(Notifications.Notifier):
         self.lastReceivedPacket = packet
 
     def getPacket(self, timeout=None):
-        packetList = []
         try:
-            packetList = self.decodeFromSLIP(timeout)
-            # logging.info("packet: {}".format(packetList))
+            frame = self.decodeFrameFromSLIP(timeout)
+            # logging.info("packet: {}".format(frame))
         except Exceptions.UARTPacketError:  # FIXME: This is never thrown...
             logging.exception("")
             return None
         else:
-            packet = Packet(packetList)
+            packet = Packet(frame)
             if packet.valid:
                 self.handlePacketHistory(packet)
             return packet
@@ -293,7 +354,57 @@ class PacketReader(Notifications.Notifier):
         self.sendPacket(GO_IDLE, [])
 
 
+# Precompiled header layouts, indexed by protocol version.
+# Fields: payload length, protocol version, packet counter, packet id
+HEADER_STRUCTS = {
+    PROTOVER_V1: struct.Struct("<xBBHB"),
+    PROTOVER_V2: struct.Struct("<HBHB"),
+}
+# Fields: ble header length, flags, channel, rssi, event counter, timestamp
+BLE_HEADER_STRUCT = struct.Struct("<BBBBHI")
+UINT16_STRUCT = struct.Struct("<H")
+UINT32_STRUCT = struct.Struct("<I")
+
+# The hardware adds a padding byte after the BLE header which isn't sent on air
+BLE_PADDING_POS = BLEPACKET_POS + 6
+
+
+# Packet is parsed straight from the decoded frame (bytes or memoryview), header
+# fields are unpacked with precompiled structs and the BLE packet only keeps
+# views into the frame. Lists of ints are still accepted for compatibility.
 class Packet:
+    __slots__ = (
+        "_frame",
+        "protover",
+        "packetCounter",
+        "id",
+        "payloadLength",
+        "payload",
+        "valid",
+        "OK",
+        "blePacket",
+        "bleHeaderLength",
+        "flags",
+        "channel",
+        "rawRSSI",
+        "RSSI",
+        "txAdd",
+        "eventCounter",
+        "timestamp",
+        "crcOK",
+        "direction",
+        "encrypted",
+        "micOK",
+        "phy",
+        "version",
+        "baud_rate",
+        "testId",
+        "testLength",
+        "testPayload",
+        "boardId",
+        "time",
+    )
+
     def __init__(self, packetList):
         try:
             if not packetList:
@@ -301,25 +412,26 @@ class Packet:
                     "packet list not valid: %s" % str(packetList)
                 )
 
-            self.protover = packetList[PROTOVER_POS]
-            self.packetCounter = parseLittleEndian(
-                packetList[PACKETCOUNTER_POS : PACKETCOUNTER_POS + 2]
-            )
-            self.id = packetList[ID_POS]
+            if isinstance(packetList, list):
+                packetList = bytes(packetList)
+            frame = memoryview(packetList)
+            self._frame = frame
 
-            if int(self.protover) == PROTOVER_V1:
-                self.payloadLength = packetList[PAYLOAD_LEN_POS_V1]
-            elif int(self.protover) == PROTOVER_V2:
-                self.payloadLength = parseLittleEndian(
-                    packetList[PAYLOAD_LEN_POS : PAYLOAD_LEN_POS + 2]
-                )
-            else:
+            self.protover = frame[PROTOVER_POS]
+            try:
+                headerStruct = HEADER_STRUCTS[self.protover]
+            except KeyError:
                 raise RuntimeError(
                     "Unsupported protocol version %s" % str(self.protover)
                 )
+            (
+                self.payloadLength,
+                _,
+                self.packetCounter,
+                self.id,
+            ) = headerStruct.unpack_from(frame)
 
-            self.packetList = packetList
-            self.readPayload(packetList)
+            self.readPayload(frame)
 
         except Exceptions.InvalidPacketException as e:
             logging.error("Invalid packet: %s" % str(e))
@@ -327,63 +439,59 @@ class Packet:
             self.valid = False
         except:
             logging.exception("packet creation error")
-            logging.info("packetList: " + str(packetList))
+            logging.info("packetList: " + str(list(packetList or [])))
             self.OK = False
             self.valid = False
 
     def __repr__(self):
         return "UART packet, type: " + str(self.id) + ", PC: " + str(self.packetCounter)
 
-    # def writeDynamicHeader(self, packetList):
-    # if self.headerLength == HEADER_LENGTH:
-    # packetList[PACKETCOUNTER_POS:PACKETCOUNTER_POS+2] = toLittleEndian(self.packetCounter, 2)
-    # packetList[ID_POS] = self.id
+    # The packet list as the sniffer sent it, but with the BLE padding byte removed
+    @property
+    def packetList(self):
+        return self.getList()
 
-    def readPayload(self, packetList):
+    @property
+    def baudRate(self):
+        return self.baud_rate
+
+    def readPayload(self, frame):
         self.blePacket = None
         self.OK = False
 
-        if not self.validatePacketList(packetList):
+        if not self.validatePacketList(frame):
             raise Exceptions.InvalidPacketException(
-                "packet list not valid: %s" % str(packetList)
+                "packet list not valid: %s" % str(list(frame))
             )
         else:
             self.valid = True
 
-        self.payload = packetList[PAYLOAD_POS : PAYLOAD_POS + self.payloadLength]
+        self.payload = frame[PAYLOAD_POS : PAYLOAD_POS + self.payloadLength]
 
         if self.id == EVENT_PACKET:
             try:
-                self.bleHeaderLength = packetList[BLE_HEADER_LEN_POS]
+                self.bleHeaderLength = frame[BLE_HEADER_LEN_POS]
                 if self.bleHeaderLength == BLE_HEADER_LENGTH:
-                    self.flags = packetList[FLAGS_POS]
+                    (
+                        _,
+                        self.flags,
+                        self.channel,
+                        self.rawRSSI,
+                        self.eventCounter,
+                        self.timestamp,
+                    ) = BLE_HEADER_STRUCT.unpack_from(frame, BLE_HEADER_LEN_POS)
                     self.readFlags()
-                    self.channel = packetList[CHANNEL_POS]
-                    self.rawRSSI = packetList[RSSI_POS]
                     self.RSSI = -self.rawRSSI
-                    self.txAdd = packetList[TXADD_POS] & TXADD_MSK
-                    self.eventCounter = parseLittleEndian(
-                        packetList[EVENTCOUNTER_POS : EVENTCOUNTER_POS + 2]
-                    )
-                    self.timestamp = parseLittleEndian(
-                        packetList[TIMESTAMP_POS : TIMESTAMP_POS + 4]
-                    )
-
-                    # The hardware adds a padding byte which isn't sent on air.
-                    # We remove it, and update the payload length in the packet list.
-                    self.packetList.pop(BLEPACKET_POS + 6)
+                    self.txAdd = frame[TXADD_POS] & TXADD_MSK
+                    # The padding byte is skipped rather than removed, see getList
                     self.payloadLength -= 1
-                    if self.protover >= PROTOVER_V2:
-                        # Write updated payload length back to the packet list.
-                        payloadLength = toLittleEndian(self.payloadLength, 2)
-                        packetList[PAYLOAD_LEN_POS] = payloadLength[0]
-                        packetList[PAYLOAD_LEN_POS + 1] = payloadLength[1]
-                    else:  # PROTOVER_V1
-                        packetList[PAYLOAD_LEN_POS_V1] = self.payloadLength
 
                 if self.OK:
                     try:
-                        self.blePacket = BlePacket(packetList[BLEPACKET_POS:])
+                        self.blePacket = BlePacket(
+                            frame[BLEPACKET_POS:BLE_PADDING_POS],
+                            frame[BLE_PADDING_POS + 1 :],
+                        )
                     except:
                         logging.exception("blePacket error")
             except:
@@ -391,17 +499,13 @@ class Packet:
                 logging.exception("packet error")
                 self.OK = False
         elif self.id == PING_RESP:
-            self.version = parseLittleEndian(
-                self.packetList[PAYLOAD_POS : PAYLOAD_POS + 2]
-            )
+            (self.version,) = UINT16_STRUCT.unpack_from(frame, PAYLOAD_POS)
         elif self.id == SWITCH_BAUD_RATE_RESP or self.id == SWITCH_BAUD_RATE_REQ:
-            self.baud_rate = parseLittleEndian(
-                packetList[PAYLOAD_POS : PAYLOAD_POS + 4]
-            )
+            (self.baud_rate,) = UINT32_STRUCT.unpack_from(frame, PAYLOAD_POS)
         elif self.id == TEST_RESULT_ID:
-            self.testId = packetList[PAYLOAD_POS]
-            self.testLength = packetList[PAYLOAD_POS + 1]
-            self.testPayload = packetList[PAYLOAD_POS + 2 :]
+            self.testId = frame[PAYLOAD_POS]
+            self.testLength = frame[PAYLOAD_POS + 1]
+            self.testPayload = list(frame[PAYLOAD_POS + 2 :])
 
     def readFlags(self):
         self.crcOK = not not (self.flags & 1)
@@ -411,15 +515,22 @@ class Packet:
         self.phy = (self.flags >> 4) & 7
         self.OK = self.crcOK and (self.micOK or not self.encrypted)
 
-    def getList(self):
-        # try:
-        # if self.id == EVENT_PACKET:
-        # return self.syncWord + [self.id] + [self.length] + [self.flags] + [self.channel] + [self.rawRSSI] + self.eventCounter + self.timestamp + self.payload
-        # else:
-        # return self.syncWord + [self.id] + [self.length] + self.payload
-        # except AttributeError:
+    # Returns the packet as bytes, with the BLE padding byte removed and the payload
+    # length updated the same way the list based parser used to do it in place
+    def getBytes(self):
+        frame = self._frame
+        if self.id != EVENT_PACKET or self.bleHeaderLength != BLE_HEADER_LENGTH:
+            return bytes(frame)
+        packetBytes = bytearray(frame[:BLE_PADDING_POS])
+        packetBytes += frame[BLE_PADDING_POS + 1 :]
+        if self.protover >= PROTOVER_V2:
+            UINT16_STRUCT.pack_into(packetBytes, PAYLOAD_LEN_POS, self.payloadLength)
+        else:  # PROTOVER_V1
+            packetBytes[PAYLOAD_LEN_POS_V1] = self.payloadLength
+        return bytes(packetBytes)
 
-        return self.packetList
+    def getList(self):
+        return list(self.getBytes())
 
     def validatePacketList(self, packetList):
         try:
@@ -428,79 +539,87 @@ class Packet:
             else:
                 return False
         except:
-            logging.exception("Invalid packet: %s" % str(packetList))
+            logging.exception("Invalid packet: %s" % str(list(packetList)))
             return False
 
 
+# BlePacket keeps views of the access address/header and of the payload (which
+# follows the padding byte), everything else is computed when first accessed.
 class BlePacket:
-    def __init__(self, packetList):
-        self.extractAccessAddress(packetList)
-        if self.accessAddress == ADV_ACCESS_ADDRESS:
-            self.extractAdvType(packetList)
-            self.extractAdvAddress(packetList)
-            self.extractName(packetList)
-        self.extractLength(packetList)
-        self.payload = packetList[6:]
+    __slots__ = ("_header", "payload", "_advType", "_advAddress", "_name")
+
+    def __init__(self, header, payload):
+        self._header = header
+        self.payload = payload
+        self._advType = None
+        self._advAddress = None
+        self._name = None
 
     def __repr__(self):
         return "BLE packet, AAddr: " + str(self.accessAddress)
 
-    def extractAccessAddress(self, packetList):
-        self.accessAddress = packetList[0:4]
-
-    def extractAdvType(self, packetList):
-        self.advType = packetList[4] & 15
-
-    def extractAdvAddress(self, packetList):
-        addr = None
-        if (
-            self.advType == 0
-            or self.advType == 1
-            or self.advType == 2
-            or self.advType == 4
-            or self.advType == 6
-        ):
-            addrType = not not packetList[4] & 64
-            addr = packetList[6:12]
+    @property
+    def accessAddress(self):
+        return list(self._header[0:4])
+
+    @property
+    def isAdvertisement(self):
+        return self._header[0:4] == ADV_ACCESS_ADDRESS_BYTES
+
+    @property
+    def advType(self):
+        if self._advType is None:
+            if not self.isAdvertisement:
+                raise AttributeError("advType")
+            self._advType = self._header[4] & 15
+        return self._advType
+
+    @property
+    def length(self):
+        return self._header[5]
+
+    @property
+    def advAddress(self):
+        if self._advAddress is None:
+            self._advAddress = self.extractAdvAddress()
+        return self._advAddress
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._name = self.extractName()
+        return self._name
+
+    def extractAdvAddress(self):
+        if self.advType in (0, 1, 2, 4, 6):
+            addr = list(self.payload[0:6])
             addr.reverse()
-            addr += [addrType]
         elif self.advType == 3 or self.advType == 5:
-            addrType = not not packetList[4] & 64
-            addr = packetList[12:18]
+            addr = list(self.payload[6:12])
             addr.reverse()
-            addr += [addrType]
-
-        self.advAddress = addr
+        else:
+            return None
+        addrType = not not self._header[4] & 64
+        return addr + [addrType]
 
-    def extractName(self, packetList):
+    def extractName(self):
         name = ""
-        if (
-            self.advType == 0
-            or self.advType == 2
-            or self.advType == 4
-            or self.advType == 6
-        ):
-            i = 12
-            while i < len(packetList):
-                length = packetList[i]
-                if (i + length + 1) > len(packetList) or length == 0:
+        if self.advType in (0, 2, 4, 6):
+            payload = self.payload
+            i = 6
+            while i < len(payload):
+                length = payload[i]
+                if (i + length + 1) > len(payload) or length == 0:
                     break
-                type = packetList[i + 1]
+                type = payload[i + 1]
                 if type == 8 or type == 9:
-                    nameList = packetList[i + 2 : i + length + 1]
-                    name = ""
-                    for j in nameList:
-                        name += chr(j)
+                    name = bytes(payload[i + 2 : i + length + 1]).decode("latin-1")
                 i += length + 1
             name = '"' + name + '"'
         elif self.advType == 1:
             name = "[ADV_DIRECT_IND]"
 
-        self.name = name  # .decode(encoding="UTF-8")
-
-    def extractLength(self, packetList):
-        length = packetList[5]
-        self.length = length
+        return name
 
 
 def parseLittleEndian(list):
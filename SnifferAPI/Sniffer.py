@@ -72,7 +72,7 @@ class Sniffer(threading.Thread, SnifferCollector.SnifferCollector):
     # API STARTS HERE
 
     # Get [number] number of packets since last fetch (-1 means all)
-    # Note that the packet buffer is limited to about 80000 packets.
+    # Note that the packet buffer is limited to packet_history_size (default 100000) packets.
     # Returns: A list of Packet objects
     def getPackets(self, number=-1):
         return self._getPackets(number)
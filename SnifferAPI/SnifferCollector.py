@@ -65,6 +65,64 @@ STATE_FOLLOWING = 2
 
 ADV_ACCESS_ADDRESS = [0xD6, 0xBE, 0x89, 0x8E]
 
+DEFAULT_PACKET_HISTORY_SIZE = 100000
+
+
+# Fixed-capacity ring buffer of the last received packets. Once full the oldest
+# packet is overwritten, and packets are found by packet counter through an index
+# pointing to the latest packet with that counter. A size of 0 keeps no packets.
+class PacketHistory:
+    def __init__(self, size=DEFAULT_PACKET_HISTORY_SIZE):
+        self._size = size
+        self._slots = [None] * size
+        # sequence numbers of the oldest packet and of the next packet
+        self._start = 0
+        self._end = 0
+        self._sequenceByCounter = {}
+
+    def __len__(self):
+        return self._end - self._start
+
+    def append(self, packet):
+        if self._size == 0:
+            return
+        if self._end - self._start == self._size:
+            self._dropOldest()
+        self._slots[self._end % self._size] = packet
+        self._sequenceByCounter[packet.packetCounter] = self._end
+        self._end += 1
+
+    def _dropOldest(self):
+        index = self._start % self._size
+        packet = self._slots[index]
+        self._slots[index] = None
+        if self._sequenceByCounter.get(packet.packetCounter) == self._start:
+            del self._sequenceByCounter[packet.packetCounter]
+        self._start += 1
+
+    def findByPacketCounter(self, packetCounterValue):
+        sequence = self._sequenceByCounter.get(
+            packetCounterValue % Packet.PACKET_COUNTER_CAP
+        )
+        if sequence is None:
+            return None
+        return self._slots[sequence % self._size]
+
+    # Removes and returns [number] oldest packets (-1 means all)
+    def pop(self, number=-1):
+        count = len(self) if number < 0 else min(number, len(self))
+        packets = [
+            self._slots[(self._start + i) % self._size] for i in range(count)
+        ]
+        for _ in range(count):
+            self._dropOldest()
+        return packets
+
+    def clear(self):
+        self._slots = [None] * self._size
+        self._start = self._end = 0
+        self._sequenceByCounter.clear()
+
 
 class SnifferCollector(Notifications.Notifier):
     def __init__(self, portnum=None, baudrate=None, *args, **kwargs):
@@ -74,13 +132,19 @@ class SnifferCollector(Notifications.Notifier):
         self._fwversion = 0
         self._setState(STATE_INITIALIZING)
         self._captureHandler = CaptureFiles.CaptureFileHandler(
-            capture_file_path=kwargs.get("capture_file_path", None)
+            capture_file_path=kwargs.get("capture_file_path", None),
+            flush_interval=kwargs.get(
+                "capture_flush_interval", CaptureFiles.DEFAULT_FLUSH_INTERVAL
+            ),
+            background_flush=kwargs.get("capture_background_flush", False),
         )
         self._exit = False
         self._connectionAccessAddress = None
         self._packetListLock = threading.RLock()
         with self._packetListLock:
-            self._packets = []
+            self._packets = PacketHistory(
+                kwargs.get("packet_history_size", DEFAULT_PACKET_HISTORY_SIZE)
+            )
 
         self._packetReader = Packet.PacketReader(
             self._portnum, baudrate=baudrate, callbacks=[("*", self.passOnNotification)]
@@ -238,11 +302,7 @@ class SnifferCollector(Notifications.Notifier):
 
     def _findPacketByPacketCounter(self, packetCounterValue):
         with self._packetListLock:
-            for i in range(-1, -1 - len(self._packets), -1):
-                # iterate backwards through packets
-                if self._packets[i].packetCounter == packetCounterValue:
-                    return self._packets[i]
-        return None
+            return self._packets.findByPacketCounter(packetCounterValue)
 
     def _startScanning(self):
         logging.info("starting scan")
@@ -258,6 +318,7 @@ class SnifferCollector(Notifications.Notifier):
         self._exit = True
         self.notify("APP_EXIT")
         self._packetReader.doExit()
+        self._captureHandler.close()
         # Clear method references to avoid uncollectable cyclic references
         self.clearCallbacks()
         self._devices.clearCallbacks()
@@ -279,19 +340,15 @@ class SnifferCollector(Notifications.Notifier):
 
     def _appendPacket(self, packet):
         with self._packetListLock:
-            if len(self._packets) > 100000:
-                self._packets = self._packets[20000:]
             self._packets.append(packet)
 
     def _getPackets(self, number=-1):
         with self._packetListLock:
-            returnList = self._packets[0:number]
-            self._packets = self._packets[number:]
-        return returnList
+            return self._packets.pop(number)
 
     def _clearPackets(self):
         with self._packetListLock:
-            del self._packets[:]
+            self._packets.clear()
 
     def _sendTestPacket(self, payload):
         self._packetReader.sendTestPacket(payload)
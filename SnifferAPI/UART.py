@@ -33,13 +33,18 @@
 # OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import collections
+import json
 import logging
+import os
 import serial
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Thread, Event
 
 import serial.tools.list_ports as list_ports
 
 from . import Exceptions
+from . import Logger
 from . import Packet
 
 
@@ -47,54 +52,192 @@ SNIFFER_OLD_DEFAULT_BAUDRATE = 460800
 # Baudrates that should be tried (add more if required)
 SNIFFER_BAUDRATES = [1000000, 460800]
 
+# Makes pyserial find the URL handlers in this package, e.g. replay:// (see protocol_replay)
+if __package__ not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append(__package__)
 
-def find_sniffer(write_data=False):
-    open_ports = list_ports.comports()
 
-    sniffers = []
-    for port in [x.device for x in open_ports]:
-        for rate in SNIFFER_BAUDRATES:
-            reader = None
-            try:
-                reader = Packet.PacketReader(portnum=port, baudrate=rate)
-                try:
-                    if write_data:
-                        reader.sendPingReq()
-                        _ = reader.decodeFromSLIP(0.1, complete_timeout=0.1)
-                    else:
-                        _ = reader.decodeFromSLIP(0.3, complete_timeout=0.3)
-
-                    # FIXME: Should add the baud rate here, but that will be a breaking change
-                    sniffers.append(port)
-                    break
-                except (Exceptions.SnifferTimeout, Exceptions.UARTPacketError):
-                    pass
-            except (serial.SerialException, ValueError):
-                continue
-            finally:
-                if reader is not None:
-                    reader.doExit()
-    return sniffers
+# Last sniffer found is remembered here and probed first on the next start
+SNIFFER_CACHE_FILE = os.path.join(Logger.DEFAULT_LOG_FILE_DIR, "sniffer_cache.json")
+# How long the chosen sniffer is given to answer the ping asking for its version
+PING_TIMEOUT = 0.5
 
 
-def find_sniffer_baudrates(port):
-    for rate in SNIFFER_BAUDRATES:
+def _read_sniffer_cache():
+    try:
+        with open(SNIFFER_CACHE_FILE) as f:
+            cache = json.load(f)
+        return cache["port"], cache["baudrate"], cache.get("version")
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_sniffer_cache(port, baudrate, version):
+    # URLs like replay:// are not devices worth probing first next time
+    if "://" in port:
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(SNIFFER_CACHE_FILE)):
+            os.makedirs(os.path.dirname(SNIFFER_CACHE_FILE))
+        with open(SNIFFER_CACHE_FILE, "w") as f:
+            json.dump({"port": port, "baudrate": baudrate, "version": version}, f)
+    except OSError:
+        logging.exception("Unable to write sniffer cache")
+
+
+# Tries the baud rates one after another on a single port.
+# Returns {"port", "default", "other", "version"} for the first rate a SLIP frame is
+# received at, None otherwise. version is only known if the sniffer answered a ping.
+def _probe_sniffer(
+    port, rates, write_data, stop=None, skip_unavailable=True, timeout=None
+):
+    if timeout is None:
+        timeout = 0.1 if write_data else 0.3
+    for rate in rates:
+        if stop is not None and stop.is_set():
+            return None
         reader = None
         try:
             reader = Packet.PacketReader(portnum=port, baudrate=rate)
-            try:
+            if write_data:
                 reader.sendPingReq()
-                _ = reader.decodeFromSLIP(0.1, complete_timeout=0.1)
+            found = False
+            version = None
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    frame = reader.decodeFrameFromSLIP(
+                        remaining, complete_timeout=remaining
+                    )
+                except (
+                    Exceptions.SnifferTimeout,
+                    Exceptions.UARTPacketError,
+                    serial.SerialException,
+                ):
+                    break
+                found = True
+                if len(frame) > Packet.ID_POS and frame[Packet.ID_POS] == Packet.PING_RESP:
+                    packet = Packet.Packet(frame)
+                    if packet.valid:
+                        version = packet.version
+                    break
+                if not write_data:
+                    break
+            if found:
                 # TODO: possibly include additional rates based on protocol version
-                return {"default": rate, "other": []}
-            except (Exceptions.SnifferTimeout, Exceptions.UARTPacketError):
-                pass
+                return {"port": port, "default": rate, "other": [], "version": version}
+        except (serial.SerialException, ValueError):
+            if not skip_unavailable:
+                raise
+            # the port may still open at the next rate
+            continue
         finally:
             if reader is not None:
                 reader.doExit()
     return None
 
 
+# Probes all ports in parallel. With first_only the first sniffer found stops the
+# remaining probes and only that one is returned.
+def _probe_ports(ports, write_data=False, first_only=False):
+    if not ports:
+        return []
+    stop = Event()
+    executor = ThreadPoolExecutor(max_workers=len(ports))
+    futures = [
+        executor.submit(_probe_sniffer, port, SNIFFER_BAUDRATES, write_data, stop)
+        for port in ports
+    ]
+    found = []
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            found.append(result)
+            if first_only:
+                stop.set()
+                break
+    finally:
+        executor.shutdown(wait=not first_only)
+    # keep the order of the ports
+    return sorted(found, key=lambda result: ports.index(result["port"]))
+
+
+def find_sniffer(write_data=False):
+    ports = [x.device for x in list_ports.comports()]
+    # FIXME: Should add the baud rate here, but that will be a breaking change
+    return [result["port"] for result in _probe_ports(ports, write_data=write_data)]
+
+
+# Returns {"port", "default", "other", "version"} of every sniffer found.
+# Ports are only listened to unless write_data is set, pinging could disturb other serial devices.
+def find_sniffers(write_data=False):
+    ports = [x.device for x in list_ports.comports()]
+    return _probe_ports(ports, write_data=write_data)
+
+
+# Fills in version of the sniffer found by listening only, by pinging just its port.
+# The version known from the cache for the same port and rate is used as it is.
+def _add_sniffer_version(result, cached=None):
+    if result["version"] is not None:
+        return result
+    if cached is not None and cached[:2] == (result["port"], result["default"]):
+        result["version"] = cached[2]
+    if result["version"] is None:
+        pinged = _probe_sniffer(
+            result["port"],
+            [result["default"]],
+            write_data=True,
+            skip_unavailable=True,
+            timeout=PING_TIMEOUT,
+        )
+        if pinged is not None:
+            result["version"] = pinged["version"]
+    return result
+
+
+# Returns {"port", "default", "other", "version"} of one sniffer, or None if there is none.
+# The sniffer found last time is checked first, then all ports are probed in parallel.
+# Ports are only listened to unless write_data is set, pinging could disturb other serial devices,
+# once the sniffer is found only its port is pinged for the version.
+def find_first_sniffer(write_data=False, use_cache=True):
+    ports = [x.device for x in list_ports.comports()]
+    cached = _read_sniffer_cache() if use_cache else None
+    if cached is not None and cached[0] in ports:
+        port, rate, _ = cached
+        rates = [rate] + [r for r in SNIFFER_BAUDRATES if r != rate]
+        result = _probe_sniffer(port, rates, write_data)
+        if result is not None:
+            _add_sniffer_version(result, cached)
+            if (result["default"], result["version"]) != cached[1:]:
+                _write_sniffer_cache(port, result["default"], result["version"])
+            return result
+        ports.remove(port)
+
+    found = _probe_ports(ports, write_data=write_data, first_only=True)
+    if not found:
+        return None
+    result = _add_sniffer_version(found[0])
+    _write_sniffer_cache(result["port"], result["default"], result["version"])
+    return result
+
+
+def find_sniffer_baudrates(port):
+    rates = SNIFFER_BAUDRATES
+    cached = _read_sniffer_cache()
+    if cached is not None and cached[0] == port:
+        rates = [cached[1]] + [r for r in SNIFFER_BAUDRATES if r != cached[1]]
+    result = _probe_sniffer(port, rates, write_data=True, skip_unavailable=False)
+    if result is None:
+        return None
+    _write_sniffer_cache(port, result["default"], result["version"])
+    return {"default": result["default"], "other": [], "version": result["version"]}
+
+
 class Uart:
     def __init__(self, portnum=None, baudrate=None):
         self.ser = None
@@ -103,7 +246,9 @@ class Uart:
                 raise Exception("Invalid baudrate: " + str(baudrate))
 
             logging.info("Opening serial port {}".format(portnum))
-            self.ser = serial.Serial(port=portnum, baudrate=9600, rtscts=True)
+            self.ser = serial.serial_for_url(
+                portnum, baudrate=9600, rtscts=True, do_not_open=portnum is None
+            )
             self.ser.baudrate = baudrate
 
         except Exception as e:
@@ -113,6 +258,8 @@ class Uart:
             raise
 
         self.read_queue = collections.deque()
+        # Bytes of the first chunk in read_queue already returned by readByte
+        self.read_offset = 0
         self.read_queue_has_data = Event()
 
         self.worker_thread = Thread(target=self._read_worker)
@@ -131,6 +278,8 @@ class Uart:
             except serial.SerialException as e:
                 logging.info("Unable to read UART: %s" % e)
                 self.reading = False
+                # Wake any threads waiting on the queue
+                self.read_queue_has_data.set()
                 return
 
     def close(self):
@@ -160,6 +309,10 @@ class Uart:
         # logging.info('r: {}'.format(r))
         return r
 
+    # Returns all bytes received so far as one bytes object, or None on timeout
+    def readChunk(self, timeout=None):
+        return self._read_queue_get_all(timeout)
+
     def writeList(self, array):
         try:
             # logging.info('array: {}'.format(array))
@@ -171,9 +324,11 @@ class Uart:
             self.ser.close()
             raise e
 
+    # The read queue holds the chunks as they were read from the serial port,
+    # not single bytes, so the reader thread does one append per read.
     def _read_queue_extend(self, data):
         if len(data) > 0:
-            self.read_queue.extend(data)
+            self.read_queue.append(data)
             self.read_queue_has_data.set()
 
     def _read_queue_get(self, timeout=None):
@@ -181,14 +336,41 @@ class Uart:
         if self.read_queue_has_data.wait(timeout):
             self.read_queue_has_data.clear()
             try:
-                data = self.read_queue.popleft()
+                chunk = self.read_queue[0]
             except IndexError:
                 # This will happen when the class is destroyed
                 return None
+            # The chunk is not copied, only the offset into it moves
+            data = chunk[self.read_offset]
+            self.read_offset += 1
+            if self.read_offset == len(chunk):
+                self.read_queue.popleft()
+                self.read_offset = 0
             if len(self.read_queue) > 0:
                 self.read_queue_has_data.set()
         return data
 
+    def _read_queue_get_all(self, timeout=None):
+        if not self.reading and not self.read_queue:
+            return None
+        if not self.read_queue_has_data.wait(timeout):
+            return None
+        self.read_queue_has_data.clear()
+        chunks = []
+        if self.read_offset and self.read_queue:
+            # Rest of the chunk partially read by readByte
+            chunks.append(self.read_queue.popleft()[self.read_offset :])
+            self.read_offset = 0
+        while True:
+            try:
+                chunks.append(self.read_queue.popleft())
+            except IndexError:
+                break
+        if not chunks:
+            # This will happen when the class is destroyed
+            return None
+        return b"".join(chunks)
+
 
 def list_serial_ports():
     # Scan for available ports.
@@ -196,8 +378,6 @@ def list_serial_ports():
 
 
 if __name__ == "__main__":
-    import time
-
     t_start = time.time()
     s = find_sniffer()
     tn = time.time()
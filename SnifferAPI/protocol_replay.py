@@ -0,0 +1,314 @@
+"""
+pySerial URL handler replaying a recorded sniffer SLIP byte stream.
+
+    replay://<file>[?speed=<float>][&loop=<0|1>][&eof=<close|idle>]
+
+speed=1 replays in real time (paced by the firmware timestamps of the
+EVENT_PACKETs), speed=N replays N times faster and speed=0 is unthrottled
+(limited only by how fast the reader consumes the data). PING_REQ and
+SWITCH_BAUD_RATE_REQ written to the port are answered like the firmware does.
+With eof=close (default) reads fail once the recording is consumed, which the
+capture path treats as lost contact with the hardware and shuts down.
+
+Streams can be recorded from a real sniffer with record_stream().
+"""
+
+import threading
+import time
+import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, portNotOpenError, to_bytes
+
+from . import Packet
+
+# Firmware version reported in PING_RESP
+FAKE_FIRMWARE_VERSION = 1111
+TIMESTAMP_CAP = 2**32
+# How many bytes may wait in the input buffer before the replay thread pauses
+MAX_BUFFERED_BYTES = 64 * 1024
+
+
+def _encodeFrame(frame):
+    return (
+        bytes([Packet.SLIP_START])
+        + bytes(frame)
+        .replace(
+            bytes([Packet.SLIP_ESC]), bytes([Packet.SLIP_ESC, Packet.SLIP_ESC_ESC])
+        )
+        .replace(
+            bytes([Packet.SLIP_START]), bytes([Packet.SLIP_ESC, Packet.SLIP_ESC_START])
+        )
+        .replace(
+            bytes([Packet.SLIP_END]), bytes([Packet.SLIP_ESC, Packet.SLIP_ESC_END])
+        )
+        + bytes([Packet.SLIP_END])
+    )
+
+
+def _makeFrame(packetId, packetCounter, payload):
+    return (
+        len(payload).to_bytes(2, "little")
+        + bytes([Packet.PROTOVER_V2])
+        + (packetCounter % Packet.PACKET_COUNTER_CAP).to_bytes(2, "little")
+        + bytes([packetId])
+        + bytes(payload)
+    )
+
+
+def load_stream(file_name):
+    """
+    Split a recorded stream into (delay in seconds since previous frame, encoded frame)
+    """
+    decoder = Packet.SlipDecoder()
+    with open(file_name, "rb") as f:
+        frames = decoder.feed(f.read())
+
+    stream = []
+    lastTimestamp = None
+    for frame in frames:
+        delay = 0.0
+        packet = Packet.Packet(frame)
+        if packet.valid and packet.id == Packet.EVENT_PACKET:
+            try:
+                timestamp = packet.timestamp
+            except AttributeError:
+                timestamp = None
+            if timestamp is not None:
+                if packet.protover >= Packet.PROTOVER_V2:
+                    if lastTimestamp is not None:
+                        delay = ((timestamp - lastTimestamp) % TIMESTAMP_CAP) / 1e6
+                    lastTimestamp = timestamp
+                else:
+                    # Protocol version 1 reports the time since the previous packet
+                    delay = timestamp / 1e6
+        stream.append((delay, _encodeFrame(frame)))
+    return stream
+
+
+def record_stream(port, file_name, baudrate=None, duration=60.0):
+    """
+    Record what a real sniffer sends while scanning into file_name
+    """
+    reader = Packet.PacketReader(portnum=port, baudrate=baudrate)
+    try:
+        reader.sendScan()
+        end = time.time() + duration
+        with open(file_name, "wb") as f:
+            while time.time() < end:
+                chunk = reader.uart.readChunk(timeout=max(end - time.time(), 0))
+                if chunk:
+                    f.write(chunk)
+    finally:
+        reader.doExit()
+
+
+class Serial(SerialBase):
+    """Serial port replaying a recorded nRF Sniffer byte stream"""
+
+    BAUDRATES = SerialBase.BAUDRATES + (460800, 1000000)
+
+    def __init__(self, *args, **kwargs):
+        self.speed = 1.0
+        self.loop = False
+        self.close_at_eof = True
+        self._buffer = bytearray()
+        self._condition = threading.Condition()
+        self._finished = False
+        self._cancelled = False
+        self._stop = threading.Event()
+        self._commands = Packet.SlipDecoder()
+        self._packetCounter = 0
+        self._replayThread = None
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        fileName = self.from_url(self.port)
+        try:
+            self._stream = load_stream(fileName)
+        except OSError as e:
+            raise SerialException("Could not open replay file: %s" % e)
+
+        self._buffer = bytearray()
+        self._finished = False
+        self._cancelled = False
+        self._stop.clear()
+        self.is_open = True
+        # Replay starts with the first read, so nothing is lost to reset_input_buffer
+        self._replayThread = threading.Thread(target=self._replay)
+        self._replayThread.daemon = True
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self._stop.set()
+            with self._condition:
+                self._condition.notify_all()
+            if self._replayThread.is_alive():
+                self._replayThread.join()
+        super(Serial, self).close()
+
+    def from_url(self, url):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "replay":
+            raise SerialException(
+                'expected a string in the form "replay://<file>[?speed=1][&loop=0][&eof=close]": '
+                "not starting with replay:// ({!r})".format(parts.scheme)
+            )
+        try:
+            for option, values in urlparse.parse_qs(parts.query, True).items():
+                if option == "speed":
+                    self.speed = float(values[0])
+                    if self.speed < 0:
+                        raise ValueError("speed must not be negative")
+                elif option == "loop":
+                    self.loop = values[0] not in ("", "0", "false")
+                elif option == "eof":
+                    if values[0] not in ("close", "idle"):
+                        raise ValueError("unknown eof mode: {!r}".format(values[0]))
+                    self.close_at_eof = values[0] == "close"
+                else:
+                    raise ValueError("unknown option: {!r}".format(option))
+        except ValueError as e:
+            raise SerialException(
+                'expected a string in the form "replay://<file>[?speed=1][&loop=0][&eof=close]": {}'.format(
+                    e
+                )
+            )
+        return parts.netloc + parts.path
+
+    def _reconfigure_port(self):
+        pass
+
+    def _replay(self):
+        nextTime = time.time()
+        while True:
+            pending = bytearray()
+            for delay, data in self._stream:
+                if self.speed:
+                    nextTime += delay / self.speed
+                    wait = nextTime - time.time()
+                    if wait > 0:
+                        # Hand over everything that is due before sleeping
+                        if pending and not self._push(pending):
+                            return
+                        pending = bytearray()
+                        if self._stop.wait(wait):
+                            return
+                pending += data
+                if len(pending) >= MAX_BUFFERED_BYTES:
+                    if not self._push(pending):
+                        return
+                    pending = bytearray()
+            if pending and not self._push(pending):
+                return
+            if not self.loop or not self._stream:
+                break
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def _push(self, data):
+        with self._condition:
+            while len(self._buffer) > MAX_BUFFERED_BYTES and self.is_open:
+                self._condition.wait()
+            if not self.is_open:
+                return False
+            self._buffer += data
+            self._condition.notify_all()
+        return True
+
+    def _respond(self, packetId, payload):
+        frame = _makeFrame(packetId, self._packetCounter, payload)
+        self._packetCounter += 1
+        with self._condition:
+            self._buffer += _encodeFrame(frame)
+            self._condition.notify_all()
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise portNotOpenError
+        return len(self._buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise portNotOpenError
+        deadline = None if self._timeout is None else time.time() + self._timeout
+        with self._condition:
+            if self._replayThread.ident is None:
+                self._replayThread.start()
+            while not self._buffer and self.is_open and not self._cancelled:
+                if self._finished and self.close_at_eof:
+                    raise SerialException("end of replayed stream")
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            self._cancelled = False
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._condition.notify_all()
+        return data
+
+    def cancel_read(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def write(self, data):
+        if not self.is_open:
+            raise portNotOpenError
+        data = to_bytes(data)
+        for frame in self._commands.feed(data):
+            command = Packet.Packet(frame)
+            if not command.valid:
+                continue
+            if command.id == Packet.PING_REQ:
+                self._respond(
+                    Packet.PING_RESP, FAKE_FIRMWARE_VERSION.to_bytes(2, "little")
+                )
+            elif command.id == Packet.SWITCH_BAUD_RATE_REQ:
+                self._respond(
+                    Packet.SWITCH_BAUD_RATE_RESP, command.baudRate.to_bytes(4, "little")
+                )
+        return len(data)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise portNotOpenError
+        with self._condition:
+            del self._buffer[:]
+            self._condition.notify_all()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise portNotOpenError
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    @property
+    def cts(self):
+        return True
+
+    @property
+    def dsr(self):
+        return True
+
+    @property
+    def ri(self):
+        return False
+
+    @property
+    def cd(self):
+        return True
@@ -0,0 +1,21 @@
+from typing import Optional
+
+# AD structure: complete list of 16-bit service UUIDs containing 0xFD6F (Exposure Notification)
+EN_SERVICE_UUID = bytes.fromhex("03036ffd")
+# AD structure header of 0xFD6F service data (RPI + AEM)
+EN_SERVICE_DATA = bytes.fromhex("17166ffd")
+# advertising PDU payload captured by sniffer ends with CRC
+CRC_LENGTH = 3
+
+
+def exposure_notification_service_data(payload: bytes) -> Optional[str]:
+    """
+    Returns hex encoded service data (RPI + AEM) of EN advertising payload or None if it is not EN advertisement
+    """
+    payload = bytes(payload)
+    if EN_SERVICE_UUID not in payload:
+        return None
+    index = payload.find(EN_SERVICE_DATA)
+    if index < 0:
+        return None
+    return payload[index + len(EN_SERVICE_DATA) : -CRC_LENGTH].hex()
@@ -1,8 +1,32 @@
 import abc
-from typing import List
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, List
 
+from bluetooth.discovery.data import Encounter
 from listeners.base import EncounterListener
 
+if TYPE_CHECKING:
+    from bluetooth.discovery.csv_chunks import EncounterColumns
+
+# encounters passed to listeners at once
+BATCH_SIZE = 1024
+# how long (in seconds) a live encounter may wait for its batch to fill up
+BATCH_DELAY = 0.1
+
+
+def batches(
+    encounters: Iterable[Encounter], size: int = BATCH_SIZE
+) -> Iterator[List[Encounter]]:
+    batch = []
+    for encounter in encounters:
+        batch.append(encounter)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 
 class BluetoothDiscovery(abc.ABC):
     def __init__(self, listeners: List[EncounterListener]) -> None:
@@ -12,6 +36,73 @@ class BluetoothDiscovery(abc.ABC):
     def start(self) -> None:
         pass
 
+    def notify(self, encounters: List[Encounter]) -> None:
+        for listener in self.listeners:
+            listener.new_encounters(encounters=encounters)
+
+    def notify_columns(self, columns: "EncounterColumns") -> None:
+        for listener in self.listeners:
+            listener.new_encounter_columns(columns=columns)
+
     def cleanup(self):
         for listener in self.listeners:
             listener.cleanup()
+
+
+class EncounterBatcher:
+    """
+    Collects encounters seen live and passes them to listeners in batches of up to max_size,
+    the batch is passed on also when its first encounter waited max_delay seconds (checked by background thread)
+    """
+
+    def __init__(
+        self,
+        listeners: List[EncounterListener],
+        max_size: int = BATCH_SIZE,
+        max_delay: float = BATCH_DELAY,
+    ) -> None:
+        self.listeners = listeners
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.batch: List[Encounter] = []
+        self.first_time = 0.0
+        # guards the pending batch, listeners are called without it so adding encounters never waits for them
+        self.lock = threading.Lock()
+        # listeners get batches one by one and in order
+        self.dispatch_lock = threading.Lock()
+        self.closing = threading.Event()
+        self.flusher = threading.Thread(
+            target=self.run, name="encounter batcher", daemon=True
+        )
+        self.flusher.start()
+
+    def add(self, encounter: Encounter) -> None:
+        with self.lock:
+            if not self.batch:
+                self.first_time = time.monotonic()
+            self.batch.append(encounter)
+            if len(self.batch) < self.max_size:
+                return
+        self.flush()
+
+    def flush(self, max_delay: float = 0.0) -> None:
+        """
+        Passes the pending batch to listeners if its first encounter waited at least max_delay seconds
+        """
+        # taking the batch under dispatch lock keeps batches in the order they were taken
+        with self.dispatch_lock:
+            with self.lock:
+                if not self.batch or time.monotonic() - self.first_time < max_delay:
+                    return
+                batch, self.batch = self.batch, []
+            for listener in self.listeners:
+                listener.new_encounters(encounters=batch)
+
+    def run(self) -> None:
+        while not self.closing.wait(self.max_delay / 2):
+            self.flush(max_delay=self.max_delay)
+
+    def close(self) -> None:
+        self.closing.set()
+        self.flusher.join()
+        self.flush()
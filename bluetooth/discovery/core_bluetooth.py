@@ -5,7 +5,7 @@ import objc
 from Foundation import NSBundle, CBUUID
 from PyObjCTools import AppHelper
 
-from bluetooth.discovery.base import BluetoothDiscovery
+from bluetooth.discovery.base import BluetoothDiscovery, EncounterBatcher
 from bluetooth.discovery.data import Encounter
 
 constants = [
@@ -26,8 +26,10 @@ objc.loadBundleVariables(CoreBluetooth, globals(), constants)
 
 class CoreBluetoothDiscovery(BluetoothDiscovery):
     UUID = "0000fd6f-0000-1000-8000-00805f9b34fb"
+    batcher = None
 
     def start(self) -> None:
+        self.batcher = EncounterBatcher(self.listeners)
         central_manager = CBCentralManager.alloc()
         central_manager.initWithDelegate_queue_(self, None)
         AppHelper.runConsoleEventLoop(installInterrupt=True)
@@ -55,5 +57,9 @@ class CoreBluetoothDiscovery(BluetoothDiscovery):
             time=datetime.now(),
             rssi=rssi.intValue(),
         )
-        for listener in self.listeners:
-            listener.new_encounter(encounter=encounter)
+        self.batcher.add(encounter)
+
+    def cleanup(self):
+        if self.batcher:
+            self.batcher.close()
+        super().cleanup()
@@ -1,29 +1,125 @@
 import csv
 import datetime
+import time
 from time import sleep
-from typing import List, TextIO
+from typing import Iterator, List, TextIO
 
-from bluetooth.discovery.base import BluetoothDiscovery
+from bluetooth.discovery.base import BATCH_SIZE, BluetoothDiscovery, batches
 from bluetooth.discovery.data import Encounter
 from listeners.base import EncounterListener
 
 
+def encounter_from_row(row: List[str]) -> Encounter:
+    return Encounter(
+        time=datetime.datetime.fromisoformat(row[0]),
+        device_key=row[1],
+        service_data=row[2],
+        rssi=int(row[3]),
+    )
+
+
+def read_encounters(encounters_log: TextIO) -> Iterator[Encounter]:
+    for row in csv.reader(encounters_log):
+        if row:
+            yield encounter_from_row(row)
+
+
+def encounter_to_csv(encounter: Encounter) -> str:
+    return f"{encounter.time.isoformat()},{encounter.device_key},{encounter.service_data},{encounter.rssi}\n"
+
+
 class CSVDiscovery(BluetoothDiscovery):
-    def __init__(self, listeners: List[EncounterListener], encounters_log: TextIO):
+    """
+    Discovery replaying CSV encounters log, paced by the gaps between logged times:
+    speed=1 replays in real time, speed=N N times faster and speed=0 as fast as possible.
+    At the end of the log it waits to be terminated (like live backends) unless exit_at_eof is set.
+    Rows/s, encounters/s and time spent in every listener are printed on cleanup.
+    """
+
+    def __init__(
+        self,
+        listeners: List[EncounterListener],
+        encounters_log: TextIO,
+        speed: float = 0,
+        exit_at_eof: bool = False,
+    ):
+        if speed < 0:
+            raise ValueError("speed must not be negative")
         super().__init__(listeners=listeners)
         self.encounters_log = encounters_log
+        self.speed = speed
+        self.exit_at_eof = exit_at_eof
+        self.rows_count = 0
+        self.encounters_count = 0
+        self.listener_times = [0.0] * len(listeners)
+        self.start_time = None
+        self.stop_time = None
 
-    def start(self) -> None:
-        reader = csv.reader(self.encounters_log)
-        for row in reader:
-            encounter = Encounter(
-                time=datetime.datetime.fromisoformat(row[0]),
-                device_key=row[1],
-                service_data=row[2],
-                rssi=int(row[3]),
+    def read_encounters(self) -> Iterator[Encounter]:
+        for row in csv.reader(self.encounters_log):
+            self.rows_count += 1
+            # blank lines are skipped
+            if row:
+                yield encounter_from_row(row)
+
+    def paced(self, encounters: Iterator[Encounter]) -> Iterator[List[Encounter]]:
+        """
+        Batches of encounters which are due, the batch is cut short whenever replay has to wait
+        """
+        first_time = None
+        batch = []
+        for encounter in encounters:
+            if first_time is None:
+                first_time = encounter.time
+            delay = (
+                self.start_time
+                + (encounter.time - first_time).total_seconds() / self.speed
+                - time.time()
             )
-            for listener in self.listeners:
-                listener.new_encounter(encounter=encounter)
+            if delay > 0:
+                if batch:
+                    yield batch
+                    batch = []
+                sleep(delay)
+            batch.append(encounter)
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def notify(self, encounters: List[Encounter]) -> None:
+        self.encounters_count += len(encounters)
+        for index, listener in enumerate(self.listeners):
+            start = time.perf_counter()
+            listener.new_encounters(encounters=encounters)
+            self.listener_times[index] += time.perf_counter() - start
+
+    def start(self) -> None:
+        self.start_time = time.time()
+        encounters = self.read_encounters()
+        for batch in self.paced(encounters) if self.speed else batches(encounters):
+            self.notify(batch)
+        self.stop_time = time.time()
 
-        while True:
+        while not self.exit_at_eof:
             sleep(10)
+
+    def print_stats(self) -> None:
+        if self.start_time is None:
+            return
+        duration = max((self.stop_time or time.time()) - self.start_time, 1e-9)
+        print(
+            f"{self.rows_count} rows ({self.rows_count / duration:.1f}/s), "
+            f"{self.encounters_count} encounters ({self.encounters_count / duration:.1f}/s) "
+            f"in {duration:.1f}s"
+        )
+        for listener, listener_time in zip(self.listeners, self.listener_times):
+            print(
+                f"{type(listener).__name__}: {listener_time:.3f}s "
+                f"({listener_time / duration:.1%} of the run)"
+            )
+
+    def cleanup(self):
+        super().cleanup()
+        self.print_stats()
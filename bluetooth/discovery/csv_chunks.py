@@ -0,0 +1,260 @@
+"""
+NumPy based loader of CSV encounters log (as written by LogListener) parsing it in large chunks.
+
+Rows are located by offsets of newlines and commas and timestamps and rssi are parsed with digit arithmetic
+on the whole chunk at once, device key and service data pairs are mapped to integer codes.
+Chunks not in the exact LogListener format (quoted fields, timezones...) are parsed row by row with csv module
+into encounters the same way CSVDiscovery reads them, so timezone aware times stay aware.
+"""
+
+import csv
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bluetooth.discovery.base import BluetoothDiscovery, batches
+from bluetooth.discovery.csv import encounter_from_row
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+
+CHUNK_SIZE = 16 * 1024 * 1024
+NEWLINE = ord("\n")
+COMMA = ord(",")
+ZERO = ord("0")
+MINUS = ord("-")
+# positions of separators in YYYY-MM-DDTHH:MM:SS.ffffff
+TIME_SEPARATORS = {4: b"-", 7: b"-", 10: b"T ", 13: b":", 16: b":"}
+TIME_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+MICROSECOND_DIGITS = list(range(20, 26))
+SHORT_TIME_LENGTH = 19
+LONG_TIME_LENGTH = 26
+MAX_RSSI_LENGTH = 4
+HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+Device = Tuple[str, str]
+
+
+@dataclass(frozen=True)
+class EncounterColumns:
+    """
+    Chunk of encounters as arrays, device codes are indexes to devices (shared by all chunks of the log or its segment)
+    """
+
+    times: np.ndarray  # datetime64[us]
+    device_codes: np.ndarray  # int32
+    rssis: np.ndarray  # int16
+    devices: List[Device]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def encounters(self) -> Iterator[Encounter]:
+        devices = self.devices
+        for time, code, rssi in zip(
+            self.times.tolist(), self.device_codes.tolist(), self.rssis.tolist()
+        ):
+            device_key, service_data = devices[code]
+            yield Encounter(device_key, service_data, time, rssi)
+
+    def batches(self) -> Iterator[List[Encounter]]:
+        return batches(self.encounters())
+
+
+class DeviceCodes:
+    def __init__(self) -> None:
+        self.codes: Dict[Device, int] = {}
+        self.devices: List[Device] = []
+
+    def code(self, device: Device) -> int:
+        code = self.codes.get(device)
+        if code is None:
+            code = self.codes[device] = len(self.devices)
+            self.devices.append(device)
+        return code
+
+
+def digits(buffer: np.ndarray, offsets: np.ndarray, width: int) -> np.ndarray:
+    value = np.zeros(len(offsets), dtype=np.int64)
+    for position in range(width):
+        value = value * 10 + buffer[offsets + position] - ZERO
+    return value
+
+
+def unique_devices(
+    buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> Tuple[List[bytes], np.ndarray]:
+    """
+    Distinct "device_key,service_data" fields and index of every row's field among them
+    """
+    lengths = ends - starts
+    # fields padded with zeros to whole 8 byte words
+    width = (int(lengths.max()) // 8 + 1) * 8
+    padded = np.concatenate((buffer, np.zeros(width, dtype=np.uint8)))
+    fields = sliding_window_view(padded, width)[starts]
+    np.multiply(fields, np.arange(width) < lengths[:, None], out=fields)
+    words = fields.view(np.uint64)
+
+    # group rows by hash of the words, then check every row equals the first one of its group
+    hashes = words[:, 0].copy()
+    for column in range(1, words.shape[1]):
+        hashes *= HASH_MULTIPLIER
+        hashes ^= words[:, column]
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    if not np.array_equal(words, words[first[inverse]]):
+        # hash collision
+        _, first, inverse = np.unique(
+            fields.view(f"S{width}").ravel(), return_index=True, return_inverse=True
+        )
+        inverse = inverse.ravel()
+    return [fields[row].tobytes().rstrip(b"\0") for row in first], inverse
+
+
+def parse_chunk(data: bytes, device_codes: DeviceCodes) -> Optional[EncounterColumns]:
+    """
+    Vectorized parsing of complete lines, None if they are not exactly in LogListener format
+    """
+    # padding so reading fixed width fields of the last line can not go past the end
+    buffer = np.frombuffer(data + b"\0" * LONG_TIME_LENGTH, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == NEWLINE)
+    starts = np.concatenate(([0], newlines[:-1] + 1))
+    commas = np.flatnonzero(buffer == COMMA)
+    if len(commas) != 3 * len(newlines):
+        return None
+    commas = commas.reshape(-1, 3)
+    # with the right count, this means exactly 3 commas on every line
+    if np.any(commas[:, 0] <= starts) or np.any(commas[:, 2] >= newlines):
+        return None
+
+    time_lengths = commas[:, 0] - starts
+    long_times = time_lengths == LONG_TIME_LENGTH
+    if not np.all(long_times | (time_lengths == SHORT_TIME_LENGTH)):
+        return None
+    for position, separators in TIME_SEPARATORS.items():
+        characters = buffer[starts + position]
+        if not np.all(
+            np.logical_or.reduce([characters == separator for separator in separators])
+        ):
+            return None
+    if np.any(long_times & (buffer[starts + SHORT_TIME_LENGTH] != ord("."))):
+        return None
+    if np.any(buffer[starts[:, None] + TIME_DIGITS] - ZERO > 9) or np.any(
+        buffer[starts[long_times, None] + MICROSECOND_DIGITS] - ZERO > 9
+    ):
+        return None
+
+    year = digits(buffer, starts, 4)
+    month = digits(buffer, starts + 5, 2)
+    day = digits(buffer, starts + 8, 2)
+    hour = digits(buffer, starts + 11, 2)
+    minute = digits(buffer, starts + 14, 2)
+    second = digits(buffer, starts + 17, 2)
+    # out of range values are left to datetime to reject instead of overflowing into next field
+    if (
+        np.any(year < 1)
+        or np.any((month < 1) | (month > 12))
+        or np.any((day < 1) | (day > 31))
+        or np.any(hour > 23)
+        or np.any(minute > 59)
+        or np.any(second > 59)
+    ):
+        return None
+    months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (day - 1)
+    # days past the end of their month (like April 31st)
+    if np.any(days.astype("datetime64[M]") != months):
+        return None
+    seconds = hour * 3600 + minute * 60 + second
+    microseconds = np.where(long_times, digits(buffer, starts + 20, 6), 0)
+    times = days.astype("datetime64[us]") + (seconds * 1_000_000 + microseconds).astype(
+        "timedelta64[us]"
+    )
+
+    rssi_starts = commas[:, 2] + 1
+    rssi_lengths = newlines - rssi_starts
+    negative = buffer[rssi_starts] == MINUS
+    if np.any(rssi_lengths - negative < 1) or np.any(rssi_lengths > MAX_RSSI_LENGTH):
+        return None
+    rssis = np.zeros(len(newlines), dtype=np.int64)
+    for position in range(MAX_RSSI_LENGTH):
+        in_number = (position < rssi_lengths) & ~((position == 0) & negative)
+        digit = buffer[rssi_starts + position].astype(np.int64) - ZERO
+        if np.any(in_number & ((digit < 0) | (digit > 9))):
+            return None
+        rssis = np.where(in_number, rssis * 10 + digit, rssis)
+    rssis = np.where(negative, -rssis, rssis)
+
+    unique, inverse = unique_devices(buffer, commas[:, 0] + 1, commas[:, 2])
+    lookup = np.array(
+        [
+            device_codes.code(tuple(device.decode("utf-8").split(",")))
+            for device in unique
+        ],
+        dtype=np.int32,
+    )
+
+    return EncounterColumns(
+        times=times,
+        device_codes=lookup[inverse.ravel()],
+        rssis=rssis.astype(np.int16),
+        devices=device_codes.devices,
+    )
+
+
+def parse_rows(data: bytes) -> List[Encounter]:
+    return [
+        encounter_from_row(row)
+        for row in csv.reader(data.decode("utf-8").splitlines())
+        if row
+    ]
+
+
+def read_chunks(
+    encounters_log: BinaryIO, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Union[EncounterColumns, List[Encounter]]]:
+    """
+    Chunks of the log as arrays, or as encounters when they had to be parsed row by row
+    """
+    # text files opened by click are read through their binary buffer
+    encounters_log = getattr(encounters_log, "buffer", encounters_log)
+    device_codes = DeviceCodes()
+    rest = b""
+    while True:
+        data = encounters_log.read(chunk_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        data, rest = data[:end], data[end:]
+        if data:
+            columns = parse_chunk(data, device_codes)
+            yield parse_rows(data) if columns is None else columns
+    if rest.strip():
+        yield parse_rows(rest)
+
+
+class ChunkedCSVDiscovery(BluetoothDiscovery):
+    """
+    Discovery reading CSV encounters log in large chunks, listeners get them as columns when parsed with NumPy
+    or in batches otherwise. It ends with the log.
+    """
+
+    def __init__(
+        self,
+        listeners: List[EncounterListener],
+        encounters_log: BinaryIO,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        super().__init__(listeners=listeners)
+        self.encounters_log = encounters_log
+        self.chunk_size = chunk_size
+
+    def start(self) -> None:
+        for chunk in read_chunks(self.encounters_log, self.chunk_size):
+            if isinstance(chunk, EncounterColumns):
+                self.notify_columns(chunk)
+            else:
+                for batch in batches(chunk):
+                    self.notify(batch)
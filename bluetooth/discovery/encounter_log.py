@@ -0,0 +1,310 @@
+"""
+Binary encounter log, much smaller and faster to read than CSV log.
+
+File is a sequence of segments, each starting with MAGIC (appending to the log starts a new segment).
+Segment consists of blocks of up to BLOCK_RECORDS encounters stored column by column:
+    BLOCK_HEADER: records, devices first seen in this block, size and crc32 of the rest of the block,
+        timestamp of the first record (us since epoch, local time of the record), utc offset in seconds (NAIVE if none)
+    new devices: DEVICE_HEADER (lengths) + utf-8 device key + utf-8 service data, ids are given in order
+    int32 time deltas (us) from the previous record
+    uint32 device ids (unique within the segment)
+    int8 rssi
+Block which is cut short or damaged is skipped with the rest of its segment, reading continues with the next one.
+"""
+
+import zlib
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, islice
+from struct import Struct, error as StructError
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from bluetooth.discovery.base import BluetoothDiscovery, batches
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+
+try:
+    import numpy as np
+
+    from bluetooth.discovery.csv_chunks import EncounterColumns
+except ImportError:
+    # NumPy is optional, without it the log is replayed encounter by encounter
+    np = None
+
+MAGIC = b"ENCLOG2\n"
+BLOCK_HEADER = Struct("<IIIIqi")
+DEVICE_HEADER = Struct("<HH")
+MAX_FIELD_LENGTH = 2**16 - 1
+BLOCK_RECORDS = 4096
+# bytes of delta, device id and rssi
+BLOCK_RECORD_SIZE = 9
+MAX_DELTA = 2**31 - 1
+NAIVE = -(2**31)
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+SECOND = timedelta(seconds=1)
+# how much is read at once when looking for the next segment
+SCAN_SIZE = 1024 * 1024
+
+Device = Tuple[str, str]
+
+
+@dataclass(frozen=True)
+class Block:
+    devices: List[Device]  # devices of the segment
+    utc_offset: Optional[timezone]
+    first_time: int
+    deltas: array
+    ids: array
+    rssis: array
+
+    def timestamps(self) -> Iterator[int]:
+        # the first delta is always 0
+        return islice(accumulate(self.deltas, initial=self.first_time), 1, None)
+
+
+def to_microseconds(time: datetime) -> int:
+    return (time.replace(tzinfo=None) - EPOCH) // MICROSECOND
+
+
+def from_microseconds(timestamp: int) -> datetime:
+    return EPOCH + MICROSECOND * timestamp
+
+
+def utc_offset(time: datetime) -> int:
+    offset = time.utcoffset()
+    if offset is None:
+        return NAIVE
+    if offset % SECOND:
+        raise ValueError(f"UTC offset of {time} is not in whole seconds")
+    return offset // SECOND
+
+
+class EncounterLogWriter:
+    def __init__(self, file: BinaryIO, block_records: int = BLOCK_RECORDS) -> None:
+        self.file = file
+        self.block_records = block_records
+        self.devices: Dict[Device, int] = {}
+        self.new_devices: List[Tuple[bytes, bytes]] = []
+        self.first_time = 0
+        self.last_time = 0
+        self.utc_offset = NAIVE
+        self.deltas = array("i")
+        self.ids = array("I")
+        self.rssis = array("b")
+        self.file.write(MAGIC)
+
+    def write(self, encounter: Encounter) -> None:
+        timestamp = to_microseconds(encounter.time)
+        offset = utc_offset(encounter.time)
+        device = (encounter.device_key, encounter.service_data)
+        device_id = self.devices.get(device)
+        if device_id is None:
+            fields = tuple(field.encode("utf-8") for field in device)
+            if any(len(field) > MAX_FIELD_LENGTH for field in fields):
+                raise ValueError(
+                    f"device key or service data longer than {MAX_FIELD_LENGTH} bytes"
+                )
+
+        delta = timestamp - self.last_time
+        if self.deltas and (abs(delta) > MAX_DELTA or offset != self.utc_offset):
+            self.write_block()
+        if not self.deltas:
+            self.first_time = timestamp
+            self.utc_offset = offset
+            delta = 0
+        self.last_time = timestamp
+
+        if device_id is None:
+            device_id = self.devices[device] = len(self.devices)
+            self.new_devices.append(fields)
+
+        self.deltas.append(delta)
+        self.ids.append(device_id)
+        self.rssis.append(min(max(encounter.rssi, -128), 127))
+        if len(self.deltas) >= self.block_records:
+            self.write_block()
+
+    def write_block(self) -> None:
+        if not self.deltas:
+            return
+        parts = []
+        for device_key, service_data in self.new_devices:
+            parts += [
+                DEVICE_HEADER.pack(len(device_key), len(service_data)),
+                device_key,
+                service_data,
+            ]
+        parts += [self.deltas.tobytes(), self.ids.tobytes(), self.rssis.tobytes()]
+        body = b"".join(parts)
+        self.file.write(
+            BLOCK_HEADER.pack(
+                len(self.deltas),
+                len(self.new_devices),
+                len(body),
+                zlib.crc32(body),
+                self.first_time,
+                self.utc_offset,
+            )
+            + body
+        )
+        self.new_devices = []
+        self.deltas = array("i")
+        self.ids = array("I")
+        self.rssis = array("b")
+
+    def flush(self) -> None:
+        self.write_block()
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+def read_block(file: BinaryIO, head: bytes, devices: List[Device]) -> Optional[Block]:
+    """
+    Block starting with head (already read), None if it is incomplete or damaged
+    """
+    head += file.read(BLOCK_HEADER.size - len(head))
+    if len(head) != BLOCK_HEADER.size:
+        return None
+    records, new_devices, size, crc, first_time, offset = BLOCK_HEADER.unpack(head)
+    body = file.read(size)
+    if len(body) != size or zlib.crc32(body) != crc:
+        return None
+    try:
+        position = 0
+        for _ in range(new_devices):
+            key_length, service_data_length = DEVICE_HEADER.unpack_from(body, position)
+            position += DEVICE_HEADER.size
+            device_key = body[position : position + key_length].decode("utf-8")
+            position += key_length
+            service_data = body[position : position + service_data_length].decode(
+                "utf-8"
+            )
+            position += service_data_length
+            devices.append((device_key, service_data))
+        if size - position != records * BLOCK_RECORD_SIZE:
+            return None
+        columns = []
+        for typecode in "iIb":
+            column = array(typecode)
+            end = position + records * column.itemsize
+            column.frombytes(body[position:end])
+            columns.append(column)
+            position = end
+    except (StructError, UnicodeDecodeError):
+        return None
+    return Block(
+        devices=devices,
+        utc_offset=None if offset == NAIVE else timezone(offset * SECOND),
+        first_time=first_time,
+        deltas=columns[0],
+        ids=columns[1],
+        rssis=columns[2],
+    )
+
+
+def seek_segment(file: BinaryIO, position: int) -> bool:
+    """
+    Moves to the next MAGIC after position, False if there is none
+    """
+    file.seek(position)
+    data = b""
+    while True:
+        chunk = file.read(SCAN_SIZE)
+        if not chunk:
+            return False
+        # MAGIC can be split between chunks
+        data = data[1 - len(MAGIC) :] + chunk
+        index = data.find(MAGIC)
+        if index >= 0:
+            file.seek(file.tell() - len(data) + index)
+            return True
+
+
+def read_blocks(file: BinaryIO) -> Iterator[Block]:
+    """
+    Blocks of the log, a damaged block (like an incomplete one followed by appended segment) is skipped
+    with the rest of its segment, an incomplete last block (log still being written) is ignored
+    """
+    devices: Optional[List[Device]] = None
+    while True:
+        start = file.tell()
+        head = file.read(len(MAGIC))
+        if not head:
+            return
+        if head == MAGIC:
+            devices = []
+            continue
+        block = read_block(file, head, devices) if devices is not None else None
+        if block is None:
+            if not seek_segment(file, start + 1):
+                return
+            devices = None
+            continue
+        yield block
+
+
+def block_encounters(block: Block) -> Iterator[Encounter]:
+    devices = block.devices
+    tzinfo = block.utc_offset
+    for timestamp, device_id, rssi in zip(block.timestamps(), block.ids, block.rssis):
+        device_key, service_data = devices[device_id]
+        time = from_microseconds(timestamp)
+        if tzinfo is not None:
+            time = time.replace(tzinfo=tzinfo)
+        yield Encounter(device_key, service_data, time, rssi)
+
+
+def read_encounters(file: BinaryIO) -> Iterator[Encounter]:
+    for block in read_blocks(file):
+        yield from block_encounters(block)
+
+
+def block_columns(block: Block) -> Union["EncounterColumns", List[Encounter]]:
+    """
+    Block as NumPy arrays, or as encounters when times have UTC offset (arrays are naive)
+    """
+    if block.utc_offset is not None:
+        return list(block_encounters(block))
+    times = np.cumsum(np.frombuffer(block.deltas, dtype=np.int32), dtype=np.int64)
+    times += block.first_time
+    return EncounterColumns(
+        times=times.astype("datetime64[us]"),
+        device_codes=np.frombuffer(block.ids, dtype=np.uint32).astype(np.int32),
+        rssis=np.frombuffer(block.rssis, dtype=np.int8).astype(np.int16),
+        devices=block.devices,
+    )
+
+
+def read_columns(
+    file: BinaryIO,
+) -> Iterator[Union["EncounterColumns", List[Encounter]]]:
+    for block in read_blocks(file):
+        yield block_columns(block)
+
+
+class EncounterLogDiscovery(BluetoothDiscovery):
+    """
+    Discovery replaying binary encounter log (see EncounterLogListener), listeners get it as columns
+    when NumPy is available or in batches otherwise. It ends with the log.
+    """
+
+    def __init__(self, listeners: List[EncounterListener], binary_log: BinaryIO):
+        super().__init__(listeners=listeners)
+        self.binary_log = binary_log
+
+    def start(self) -> None:
+        if np is None:
+            for batch in batches(read_encounters(self.binary_log)):
+                self.notify(batch)
+            return
+        for chunk in read_columns(self.binary_log):
+            if isinstance(chunk, EncounterColumns):
+                self.notify_columns(chunk)
+            else:
+                for batch in batches(chunk):
+                    self.notify(batch)
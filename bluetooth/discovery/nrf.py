@@ -1,17 +1,34 @@
+import heapq
+import itertools
+import queue
 import time
 from binascii import hexlify
-from datetime import datetime
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 from SnifferAPI import Sniffer, UART
-from bluetooth.discovery.base import BluetoothDiscovery
+from bluetooth.discovery.advertising import exposure_notification_service_data
+from bluetooth.discovery.base import BluetoothDiscovery, EncounterBatcher
 from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
 
 
 class NRFBluetoothDiscovery(BluetoothDiscovery):
-    UUID = "03036ffd"
-    service_data = "17166ffd"
     sniffer = None
 
+    def __init__(
+        self, listeners: List[EncounterListener], interface: Optional[str] = None
+    ) -> None:
+        super().__init__(listeners=listeners)
+        self.interface = interface
+        self.packets_count = 0
+        self.encounters_count = 0
+        self.start_time = None
+        self.stop_time = None
+        self.batcher = None
+
     def get_baud_rates(self, interface):
         return UART.find_sniffer_baudrates(interface)
 
@@ -19,41 +36,209 @@ class NRFBluetoothDiscovery(BluetoothDiscovery):
         devices = UART.find_sniffer(write_data=False)
         return devices
 
-    def new_packet(self, notification):
-        receive_time = datetime.now()
-        packet = notification.msg["packet"]
+    def find_sniffer(self) -> Tuple[str, int]:
+        if self.interface:
+            return self.interface, self.get_baud_rates(self.interface)["default"]
+        sniffer = UART.find_first_sniffer()
+        if sniffer is None:
+            raise RuntimeError("no nRF sniffer found")
+        return sniffer["port"], sniffer["default"]
+
+    def encounter_from_packet(
+        self, packet, receive_time: datetime
+    ) -> Optional[Encounter]:
         if not packet.OK:
-            return
+            return None
 
-        payload = hexlify(bytes(packet.blePacket.payload)).decode("utf-8")
-        if self.UUID not in payload:
-            return
+        service_data = exposure_notification_service_data(packet.blePacket.payload)
+        if service_data is None:
+            return None
 
-        encounter = Encounter(
+        return Encounter(
             device_key=hexlify(bytes(packet.blePacket.advAddress[:6])).decode("utf-8"),
-            service_data=payload[
-                payload.index(self.service_data) + len(self.UUID) : -6
-            ],
+            service_data=service_data,
             time=receive_time,
             rssi=packet.RSSI,
         )
-        for listener in self.listeners:
-            listener.new_encounter(encounter=encounter)
+
+    def new_packet(self, notification):
+        receive_time = datetime.now()
+        self.packets_count += 1
+        encounter = self.encounter_from_packet(notification.msg["packet"], receive_time)
+        if encounter is None:
+            return
+
+        self.encounters_count += 1
+        self.batcher.add(encounter)
 
     def start(self) -> None:
-        interface = self.get_interfaces()[0]
-        baudrate = self.get_baud_rates(interface)
-        sniffer = Sniffer.Sniffer(interface, baudrate["default"])
+        self.batcher = EncounterBatcher(self.listeners)
+        interface, baudrate = self.find_sniffer()
+        sniffer = Sniffer.Sniffer(interface, baudrate)
         sniffer.subscribe("NEW_BLE_PACKET", self.new_packet)
         sniffer.setAdvHopSequence([37, 38, 39])
+        self.start_time = time.time()
         sniffer.start()
         sniffer.scan()
         self.sniffer = sniffer
 
-        while True:
-            time.sleep(10)
+        # sniffer thread only stops when it loses contact with the hardware
+        while sniffer.is_alive():
+            sniffer.join(10)
+        self.stop_time = time.time()
+
+    def print_stats(self) -> None:
+        if self.start_time is None:
+            return
+        duration = (self.stop_time or time.time()) - self.start_time
+        if duration <= 0:
+            return
+        print(
+            f"{self.packets_count} packets ({self.packets_count / duration:.1f}/s), "
+            f"{self.encounters_count} encounters ({self.encounters_count / duration:.1f}/s) "
+            f"in {duration:.1f}s"
+        )
 
     def cleanup(self):
-        super().cleanup()
         if self.sniffer:
             self.sniffer.doExit(join=True)
+        # pass on what is left before listeners are cleaned up
+        if self.batcher:
+            self.batcher.close()
+        super().cleanup()
+        self.print_stats()
+
+
+class MultiNRFBluetoothDiscovery(NRFBluetoothDiscovery):
+    """
+    Discovery using every connected sniffer at once, each one pinned to its own advertising channel.
+    Encounters of all sniffers are merged in time order, the same advertisement seen on more channels
+    is passed to listeners only once.
+    """
+
+    CHANNELS = [37, 38, 39]
+    # how long encounters wait for encounters from other sniffers to be ordered
+    REORDER_WINDOW = timedelta(milliseconds=50)
+    # advertising event sends the same data on all channels within few ms
+    DUPLICATE_WINDOW = timedelta(milliseconds=20)
+
+    def __init__(
+        self,
+        listeners: List[EncounterListener],
+        interfaces: Optional[List[str]] = None,
+    ) -> None:
+        super().__init__(listeners=listeners)
+        self.interfaces = interfaces
+        self.sniffers: Dict[str, Sniffer.Sniffer] = {}
+        self.channels: Dict[str, List[int]] = {}
+        self.sniffer_packets = defaultdict(int)
+        self.sniffer_encounters = defaultdict(int)
+        self.duplicates_count = 0
+        self.encounters_queue = queue.Queue()
+        self.sequence = itertools.count()
+        # devices by the time they were last emitted, oldest first
+        self.last_seen: OrderedDict = OrderedDict()
+
+    def find_sniffers(self) -> List[Tuple[str, int]]:
+        if self.interfaces:
+            return [
+                (interface, self.get_baud_rates(interface)["default"])
+                for interface in self.interfaces
+            ]
+        sniffers = UART.find_sniffers()
+        if not sniffers:
+            raise RuntimeError("no nRF sniffer found")
+        return [(sniffer["port"], sniffer["default"]) for sniffer in sniffers]
+
+    def channels_for(self, index: int, count: int) -> List[int]:
+        if count >= len(self.CHANNELS):
+            return [self.CHANNELS[index % len(self.CHANNELS)]]
+        # less sniffers than channels, some of them have to hop
+        return self.CHANNELS[index::count]
+
+    def new_sniffer_packet(self, interface: str, notification) -> None:
+        receive_time = datetime.now()
+        self.sniffer_packets[interface] += 1
+        encounter = self.encounter_from_packet(notification.msg["packet"], receive_time)
+        if encounter is None:
+            return
+
+        self.sniffer_encounters[interface] += 1
+        self.encounters_queue.put((encounter.time, next(self.sequence), encounter))
+
+    def emit(self, encounter: Encounter) -> None:
+        key = (encounter.device_key, encounter.service_data)
+        last_time = self.last_seen.get(key)
+        if last_time is not None and encounter.time - last_time < self.DUPLICATE_WINDOW:
+            self.duplicates_count += 1
+            return
+        self.last_seen[key] = encounter.time
+        self.last_seen.move_to_end(key)
+        # encounters are emitted in time order, so expired devices are at the front
+        horizon = encounter.time - self.DUPLICATE_WINDOW
+        while next(iter(self.last_seen.values())) < horizon:
+            self.last_seen.popitem(last=False)
+
+        self.encounters_count += 1
+        self.batcher.add(encounter)
+
+    def start(self) -> None:
+        self.batcher = EncounterBatcher(self.listeners)
+        found = self.find_sniffers()
+        for index, (interface, baudrate) in enumerate(found):
+            sniffer = Sniffer.Sniffer(interface, baudrate)
+            sniffer.subscribe(
+                "NEW_BLE_PACKET", partial(self.new_sniffer_packet, interface)
+            )
+            self.channels[interface] = self.channels_for(index, len(found))
+            sniffer.setAdvHopSequence(self.channels[interface])
+            self.sniffers[interface] = sniffer
+
+        self.start_time = time.time()
+        for sniffer in self.sniffers.values():
+            sniffer.start()
+            sniffer.scan()
+
+        # encounters are passed to listeners from this thread, in time order
+        pending = []
+        while True:
+            running = any(sniffer.is_alive() for sniffer in self.sniffers.values())
+            try:
+                heapq.heappush(
+                    pending,
+                    self.encounters_queue.get(
+                        timeout=self.REORDER_WINDOW.total_seconds()
+                    ),
+                )
+                while True:
+                    heapq.heappush(pending, self.encounters_queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            horizon = datetime.now() - self.REORDER_WINDOW
+            while pending and (not running or pending[0][0] <= horizon):
+                self.emit(heapq.heappop(pending)[2])
+
+            if not running and not pending and self.encounters_queue.empty():
+                break
+        self.stop_time = time.time()
+
+    def print_stats(self) -> None:
+        if self.start_time is None:
+            return
+        self.packets_count = sum(self.sniffer_packets.values())
+        super().print_stats()
+        duration = max((self.stop_time or time.time()) - self.start_time, 1e-9)
+        for interface, channels in self.channels.items():
+            packets = self.sniffer_packets[interface]
+            encounters = self.sniffer_encounters[interface]
+            print(
+                f"{interface} {channels}: {packets} packets ({packets / duration:.1f}/s), "
+                f"{encounters} encounters ({encounters / duration:.1f}/s)"
+            )
+        print(f"{self.duplicates_count} duplicate encounters dropped")
+
+    def cleanup(self):
+        for sniffer in self.sniffers.values():
+            sniffer.doExit(join=True)
+        super().cleanup()
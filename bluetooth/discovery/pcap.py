@@ -0,0 +1,173 @@
+import mmap
+import os
+import struct
+from binascii import hexlify
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Tuple
+
+from SnifferAPI import CaptureFiles, Packet
+from bluetooth.discovery.advertising import (
+    EN_SERVICE_UUID,
+    exposure_notification_service_data,
+)
+from bluetooth.discovery.base import BluetoothDiscovery, batches
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+
+GLOBAL_HEADER_LENGTH = len(CaptureFiles.GLOBAL_HEADER)
+GLOBAL_HEADER_STRUCT = struct.Struct("<IHHiIII")
+RECORD_HEADER = CaptureFiles.PACKET_HEADER
+INCL_LENGTH = struct.Struct("<I")
+INCL_LENGTH_POS = 8
+# every record starts with board id, then the packet as sniffer sent it (padding byte removed)
+BOARD_ID_LENGTH = 1
+# encounter as (timestamp, device_key, service_data, rssi), cheap to pass between processes
+RawEncounter = Tuple[float, str, str, int]
+
+
+def open_capture(file_name: str) -> mmap.mmap:
+    with open(file_name, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, *_, network = GLOBAL_HEADER_STRUCT.unpack_from(mapped)
+    if (
+        magic != CaptureFiles.MAGIC_NUMBER
+        or network != CaptureFiles.LINKTYPE_NORDIC_BLE
+    ):
+        mapped.close()
+        raise ValueError(f"{file_name} is not a Nordic BLE sniffer capture")
+    return mapped
+
+
+def record_offsets(mapped: mmap.mmap) -> Tuple[List[int], int]:
+    """
+    Offsets of all complete records and the end of the last one, only record headers are read
+    """
+    offsets = []
+    offset = GLOBAL_HEADER_LENGTH
+    size = len(mapped)
+    while offset + RECORD_HEADER.size <= size:
+        (length,) = INCL_LENGTH.unpack_from(mapped, offset + INCL_LENGTH_POS)
+        end = offset + RECORD_HEADER.size + length
+        if end > size:
+            # last record was not completely written
+            break
+        offsets.append(offset)
+        offset = end
+    return offsets, offset
+
+
+def decode_records(mapped: mmap.mmap, start: int, stop: int) -> Iterator[RawEncounter]:
+    """
+    Decodes EN advertisements from records between start and stop offsets.
+    Record is copied out of the mapping only if it contains EN service UUID.
+    """
+    offset = start
+    while offset + RECORD_HEADER.size <= stop:
+        seconds, microseconds, length, _ = RECORD_HEADER.unpack_from(mapped, offset)
+        packet_start = offset + RECORD_HEADER.size + BOARD_ID_LENGTH
+        offset += RECORD_HEADER.size + length
+        if offset > stop:
+            # last record was not completely written
+            break
+        payload_start = packet_start + Packet.BLEPACKET_POS + 6
+        if (
+            mapped.find(EN_SERVICE_UUID, payload_start, offset) < 0
+            or mapped[packet_start + Packet.ID_POS] != Packet.EVENT_PACKET
+            or mapped[packet_start + Packet.BLE_HEADER_LEN_POS]
+            != Packet.BLE_HEADER_LENGTH
+        ):
+            continue
+
+        flags = mapped[packet_start + Packet.FLAGS_POS]
+        crc_ok = flags & 1
+        encrypted = flags & 4
+        mic_ok = flags & 8
+        if not crc_ok or (encrypted and not mic_ok):
+            continue
+
+        service_data = exposure_notification_service_data(mapped[payload_start:offset])
+        if service_data is None:
+            continue
+
+        adv_type = mapped[packet_start + Packet.BLEPACKET_POS + 4] & 15
+        if adv_type in (3, 5):
+            address = mapped[payload_start + 6 : payload_start + 12]
+        else:
+            address = mapped[payload_start : payload_start + 6]
+        yield (
+            seconds + microseconds / 1_000_000,
+            hexlify(address[::-1]).decode("utf-8"),
+            service_data,
+            -mapped[packet_start + Packet.RSSI_POS],
+        )
+
+
+def decode_file_range(file_name: str, start: int, stop: int) -> List[RawEncounter]:
+    mapped = open_capture(file_name)
+    try:
+        return list(decode_records(mapped, start, stop))
+    finally:
+        mapped.close()
+
+
+class PcapDiscovery(BluetoothDiscovery):
+    """
+    Discovery replaying captures written by nRF Sniffer (CaptureFileHandler), including the .1 rollover file
+    """
+
+    def __init__(
+        self, listeners: List[EncounterListener], capture_file: str, workers: int = 1
+    ) -> None:
+        super().__init__(listeners=listeners)
+        self.capture_file = capture_file
+        self.workers = workers
+
+    def capture_files(self) -> List[str]:
+        # rollover file holds the older part of capture
+        files = [self.capture_file + ".1", self.capture_file]
+        return [
+            file_name
+            for file_name in files
+            if os.path.isfile(file_name)
+            and os.path.getsize(file_name) >= GLOBAL_HEADER_LENGTH
+        ]
+
+    def read_file(self, file_name: str) -> Iterator[RawEncounter]:
+        mapped = open_capture(file_name)
+        try:
+            if self.workers <= 1:
+                yield from decode_records(mapped, GLOBAL_HEADER_LENGTH, len(mapped))
+                return
+
+            offsets, end = record_offsets(mapped)
+        finally:
+            mapped.close()
+        if not offsets:
+            return
+
+        # contiguous ranges of records, results are collected in order
+        chunk = max(len(offsets) // self.workers, 1)
+        bounds = offsets[::chunk] + [end]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for encounters in executor.map(
+                decode_file_range,
+                [file_name] * (len(bounds) - 1),
+                bounds[:-1],
+                bounds[1:],
+            ):
+                yield from encounters
+
+    def encounters(self) -> Iterator[Encounter]:
+        for file_name in self.capture_files():
+            for timestamp, device_key, service_data, rssi in self.read_file(file_name):
+                yield Encounter(
+                    device_key=device_key,
+                    service_data=service_data,
+                    time=datetime.fromtimestamp(timestamp),
+                    rssi=rssi,
+                )
+
+    def start(self) -> None:
+        for batch in batches(self.encounters()):
+            self.notify(batch)
@@ -0,0 +1,36 @@
+import click
+
+from bluetooth.discovery import csv, encounter_log
+
+
+@click.group()
+def convert_encounters():
+    """
+    Converts encounters log between CSV and binary format
+    """
+
+
+@click.command("to-binary")
+@click.argument("csv_log", type=click.File("r"))
+@click.argument("binary_log", type=click.File("wb"))
+def to_binary(csv_log, binary_log):
+    writer = encounter_log.EncounterLogWriter(binary_log)
+    for encounter in csv.read_encounters(csv_log):
+        writer.write(encounter)
+    writer.flush()
+
+
+@click.command("to-csv")
+@click.argument("binary_log", type=click.File("rb"))
+@click.argument("csv_log", type=click.File("w"))
+def to_csv(binary_log, csv_log):
+    for encounter in encounter_log.read_encounters(binary_log):
+        csv_log.write(csv.encounter_to_csv(encounter))
+
+
+convert_encounters.add_command(to_binary)
+convert_encounters.add_command(to_csv)
+
+
+if __name__ == "__main__":
+    convert_encounters()
@@ -1,19 +1,122 @@
 import sys
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Tuple
 
-from exposure_keys.keys_pb2 import TEKSignatureList, TemporaryExposureKeyExport
+from exposure_keys.keys_pb2 import (
+    TEKSignatureList,
+    TemporaryExposureKey,
+    TemporaryExposureKeyExport,
+)
+
+EXPORT_HEADER = b"EK Export v1    "
+EXPORT_FILE = "export.bin"
+SIGNATURE_FILE = "export.sig"
+# number of TemporaryExposureKeyExport.keys field
+KEYS_FIELD = 7
+CHUNK_SIZE = 1024 * 1024
+# tag and length varints of a field fit in this many bytes
+MAX_FIELD_HEADER = 20
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+
+@contextmanager
+def open_export_file(file_name: str, member: str) -> Iterator[BinaryIO]:
+    """
+    Opens member of export zip as published or the file itself when it is already unzipped
+    """
+    if zipfile.is_zipfile(file_name):
+        with zipfile.ZipFile(file_name) as archive, archive.open(member) as f:
+            yield f
+    else:
+        with open(file_name, mode="rb") as f:
+            yield f
+
+
+def read_export_header(f: BinaryIO) -> None:
+    header = f.read(len(EXPORT_HEADER))
+    if header != EXPORT_HEADER:
+        raise ValueError(f"not an exposure keys export, header is {header!r}")
+
+
+def decode_varint(buffer: bytes, position: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if position >= len(buffer):
+            raise ValueError("exposure keys export ends in the middle of a field")
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def export_fields(
+    f: BinaryIO, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Top level fields of export protobuf message as (field number, payload), payload of varint and fixed fields
+    is their encoded value. It is read in chunks, so memory use does not depend on the size of the export.
+    """
+    buffer = b""
+    position = 0
+    while True:
+        if len(buffer) - position < MAX_FIELD_HEADER:
+            buffer = buffer[position:] + f.read(chunk_size)
+            position = 0
+            if not buffer:
+                return
+        tag, position = decode_varint(buffer, position)
+        field_number, wire_type = tag >> 3, tag & 7
+        payload_start = position
+        if wire_type == WIRE_VARINT:
+            _, position = decode_varint(buffer, position)
+        elif wire_type == WIRE_FIXED64:
+            position += 8
+        elif wire_type == WIRE_FIXED32:
+            position += 4
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, payload_start = decode_varint(buffer, position)
+            position = payload_start + length
+        else:
+            raise ValueError(
+                f"unsupported wire type {wire_type} of field {field_number}"
+            )
+        while position > len(buffer):
+            data = f.read(max(position - len(buffer), chunk_size))
+            if not data:
+                raise ValueError("exposure keys export ends in the middle of a field")
+            buffer += data
+        yield field_number, buffer[payload_start:position]
+
+
+def stream_keys_from_file(file_name: str) -> Iterator[TemporaryExposureKey]:
+    """
+    Keys of export (zip or unzipped export.bin) one by one, without reading the whole export into memory
+    """
+    with open_export_file(file_name, EXPORT_FILE) as f:
+        read_export_header(f)
+        for field_number, payload in export_fields(f):
+            if field_number == KEYS_FIELD:
+                yield TemporaryExposureKey.FromString(payload)
 
 
 def decode_key_from_file(file_name: str) -> TemporaryExposureKeyExport:
-    with open(file_name, mode="rb") as f:
+    with open_export_file(file_name, EXPORT_FILE) as f:
+        read_export_header(f)
         content = f.read()
-    content = content.strip(b"EK Export v1    ")
     export = TemporaryExposureKeyExport()
     export.ParseFromString(content)
     return export
 
 
 def decode_signature_from_file(file_name: str) -> TEKSignatureList:
-    with open(file_name, mode="rb") as f:
+    with open_export_file(file_name, SIGNATURE_FILE) as f:
         content = f.read()
     signature = TEKSignatureList()
     signature.ParseFromString(content)
@@ -24,6 +127,11 @@ if __name__ == "__main__":
     """
     Usage:
         python ./decode_keys.py /1591142400-00001/
+        python ./decode_keys.py 1591142400-00001.zip
     """
-    print(decode_key_from_file(sys.argv[1] + "export.bin"))
-    print(decode_signature_from_file(sys.argv[1] + "export.sig"))
+    if zipfile.is_zipfile(sys.argv[1]):
+        print(decode_key_from_file(sys.argv[1]))
+        print(decode_signature_from_file(sys.argv[1]))
+    else:
+        print(decode_key_from_file(sys.argv[1] + EXPORT_FILE))
+        print(decode_signature_from_file(sys.argv[1] + SIGNATURE_FILE))
@@ -0,0 +1,28 @@
+import os
+
+import click
+
+from decode_keys import stream_keys_from_file
+from exposure_keys.rpi import derive_rpis_sharded
+
+
+@click.command()
+@click.argument("export_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("rpis_file", type=click.Path(dir_okay=False))
+@click.option(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of processes deriving RPIs",
+)
+def derive_export_rpis(export_file, rpis_file, workers):
+    """
+    Derives RPIs of all keys in exposure keys export (zip or export.bin) and saves them sorted by RPI
+    as NumPy array (.npy)
+    """
+    keys = stream_keys_from_file(export_file)
+    click.echo(derive_rpis_sharded(keys, rpis_file, workers=workers))
+
+
+if __name__ == "__main__":
+    derive_export_rpis()
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from exposure_keys.keys_pb2 import TemporaryExposureKey
+from exposure_keys.rpi import RPI_LENGTH, derive_rpis_sharded
+
+EMPTY = -1
+MANIFEST = "index.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class RPIHashIndex:
+    """
+    Open addressing hash table of derived RPIs (RPI_DTYPE array), table holds row numbers.
+    RPIs are AES output so their first 8 bytes are used as the hash directly,
+    table is kept at most half full so lookup probes only a few slots.
+    """
+
+    def __init__(self, rpis: np.ndarray) -> None:
+        self.rpis = rpis
+        # RPI as two little endian 64-bit words
+        self.words = np.frombuffer(rpis["rpi"].tobytes(), dtype="<u8").reshape(-1, 2)
+        size = 8
+        while size < 2 * len(rpis):
+            size *= 2
+        self.mask = size - 1
+        self.table = np.full(size, EMPTY, dtype=np.int64)
+
+        # linear probing done for all rows at once, every round places one row per free slot
+        pending = np.arange(len(rpis))
+        slots = self.words[:, 0] & np.uint64(self.mask)
+        while len(pending):
+            free = self.table[slots] == EMPTY
+            candidates = pending[free]
+            _, first = np.unique(slots[free], return_index=True)
+            self.table[slots[free][first]] = candidates[first]
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[np.flatnonzero(free)[first]] = True
+            pending = pending[~placed]
+            slots = (slots[~placed] + np.uint64(1)) & np.uint64(self.mask)
+
+    def __len__(self) -> int:
+        return len(self.rpis)
+
+    def find(self, rpi: bytes) -> Optional[int]:
+        """
+        Row of the RPI in rpis or None
+        """
+        if len(rpi) != RPI_LENGTH:
+            return None
+        low = int.from_bytes(rpi[:8], "little")
+        high = int.from_bytes(rpi[8:], "little")
+        slot = low & self.mask
+        while True:
+            row = self.table.item(slot)
+            if row == EMPTY:
+                return None
+            if self.words.item(row, 0) == low and self.words.item(row, 1) == high:
+                return row
+            slot = (slot + 1) & self.mask
+
+
+class RPISource(NamedTuple):
+    batch: str
+    key_index: int
+    interval_number: int
+
+
+def content_hash(file_name: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RPIFileIndex:
+    """
+    On-disk index of RPIs derived from export batches, every batch is stored in its own file sorted by RPI
+    (.npy of RPI_DTYPE records), which is memory mapped and binary searched, so only a few pages are read per lookup.
+    Manifest (index.json) keeps content hash of every batch's export, so unchanged batches are not derived again.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # batch -> {"sha256", "file", "keys", "rpis"}
+        self.manifest: Dict[str, dict] = {}
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file) as f:
+                self.manifest = json.load(f)
+        self.mapped: Dict[str, np.ndarray] = {}
+
+    @property
+    def manifest_file(self) -> str:
+        return os.path.join(self.directory, MANIFEST)
+
+    @property
+    def batches(self) -> List[str]:
+        return sorted(self.manifest)
+
+    def __len__(self) -> int:
+        return sum(batch["rpis"] for batch in self.manifest.values())
+
+    def save_manifest(self) -> None:
+        partial = f"{self.manifest_file}.partial"
+        with open(partial, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(partial, self.manifest_file)
+
+    def is_current(self, batch: str, sha256: str) -> bool:
+        entry = self.manifest.get(batch)
+        return (
+            entry is not None
+            and entry["sha256"] == sha256
+            and os.path.isfile(os.path.join(self.directory, entry["file"]))
+        )
+
+    def add(
+        self,
+        batch: str,
+        keys: Iterable[TemporaryExposureKey],
+        sha256: str,
+        workers: int = 1,
+    ) -> dict:
+        """
+        Derives RPIs of the batch and stores them, replacing the previous version of the batch
+        """
+        self.mapped.pop(batch, None)
+        file_name = f"{batch}.npy"
+        path = os.path.join(self.directory, file_name)
+        # batch file is replaced only once it is complete
+        stats = derive_rpis_sharded(keys, f"{path}.partial", workers=workers)
+        os.replace(f"{path}.partial", path)
+        self.manifest[batch] = {
+            "sha256": sha256,
+            "file": file_name,
+            "keys": stats["keys"],
+            "rpis": stats["rpis"],
+        }
+        self.save_manifest()
+        return stats
+
+    def rpis(self, batch: str) -> np.ndarray:
+        rpis = self.mapped.get(batch)
+        if rpis is None:
+            file_name = os.path.join(self.directory, self.manifest[batch]["file"])
+            rpis = self.mapped[batch] = np.load(file_name, mmap_mode="r")
+        return rpis
+
+    def find(
+        self, rpi: bytes, batches: Optional[Sequence[str]] = None
+    ) -> Optional[RPISource]:
+        """
+        Batch, key index and interval number which produced the RPI or None
+        """
+        if len(rpi) != RPI_LENGTH:
+            return None
+        value = np.frombuffer(rpi, dtype=f"V{RPI_LENGTH}")[0]
+        for batch in self.batches if batches is None else batches:
+            rpis = self.rpis(batch)
+            row = np.searchsorted(rpis["rpi"], value)
+            if row < len(rpis) and rpis["rpi"][row] == value:
+                record = rpis[row]
+                return RPISource(
+                    batch, int(record["key_index"]), int(record["interval_number"])
+                )
+        return None
+
+    def close(self) -> None:
+        # memory maps are closed when arrays are released
+        self.mapped = {}
@@ -0,0 +1,235 @@
+"""
+Derivation of Rolling Proximity Identifiers from Temporary Exposure Keys (Exposure Notification Cryptography v1.2):
+    RPIK = HKDF-SHA256(TEK, salt=None, info="EN-RPIK", length=16)
+    RPI = AES-128(RPIK, "EN-RPI" + 6 zero bytes + ENIntervalNumber as uint32 little endian)
+
+Padded data of all intervals of a key are encrypted by one multi-block AES-ECB call.
+Large exports can be derived by more processes, each one deriving a shard of keys (derive_rpis_sharded).
+"""
+
+import logging
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Tuple
+
+import numpy as np
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from exposure_keys.keys_pb2 import TemporaryExposureKey
+
+KEY_LENGTH = 16
+RPI_LENGTH = 16
+RPIK_INFO = b"EN-RPIK"
+PADDED_DATA_PREFIX = b"EN-RPI" + b"\0" * 6
+# ENIntervalNumber is a number of 10 minutes intervals since epoch
+INTERVAL_SECONDS = 600
+
+# rpi is compared as raw bytes, key_index points to the keys rpis were derived from
+RPI_DTYPE = np.dtype(
+    [("rpi", f"V{RPI_LENGTH}"), ("key_index", "<u4"), ("interval_number", "<u4")]
+)
+
+
+def interval_number(time: datetime) -> int:
+    if time.tzinfo is None:
+        # encounters are logged in naive local time
+        time = time.astimezone()
+    return int(time.astimezone(timezone.utc).timestamp()) // INTERVAL_SECONDS
+
+
+def derive_rpik(tek: bytes) -> bytes:
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=KEY_LENGTH,
+        salt=None,
+        info=RPIK_INFO,
+        backend=default_backend(),
+    ).derive(tek)
+
+
+def padded_data(interval_numbers: np.ndarray) -> np.ndarray:
+    """
+    AES blocks (n x 16 bytes) to be encrypted for given interval numbers
+    """
+    blocks = np.empty((len(interval_numbers), RPI_LENGTH), dtype=np.uint8)
+    blocks[:, : len(PADDED_DATA_PREFIX)] = np.frombuffer(
+        PADDED_DATA_PREFIX, dtype=np.uint8
+    )
+    blocks[:, len(PADDED_DATA_PREFIX) :] = (
+        interval_numbers.astype("<u4").reshape(-1, 1).view(np.uint8)
+    )
+    return blocks
+
+
+def key_columns(
+    keys: Iterable[TemporaryExposureKey],
+) -> Tuple[bytes, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Key data (concatenated), index, rolling start interval number and rolling period of valid keys.
+    Keys with invalid key data are skipped, key index still refers to the position in keys.
+    Keys are consumed one by one, so they can be streamed from the export.
+    """
+    key_data = bytearray()
+    indexes = array("q")
+    starts = array("q")
+    periods = array("q")
+    for index, key in enumerate(keys):
+        if len(key.key_data) != KEY_LENGTH or key.rolling_period <= 0:
+            logging.warning(f"skipping invalid exposure key {index}")
+            continue
+        key_data += key.key_data
+        indexes.append(index)
+        starts.append(key.rolling_start_interval_number)
+        periods.append(key.rolling_period)
+    return (
+        bytes(key_data),
+        np.array(indexes, dtype=np.int64),
+        np.array(starts, dtype=np.int64),
+        np.array(periods, dtype=np.int64),
+    )
+
+
+def derive_key_rpis(
+    key_data: bytes, indexes: np.ndarray, starts: np.ndarray, periods: np.ndarray
+) -> np.ndarray:
+    """
+    RPIs of all intervals of every key (RPI_DTYPE), in order of keys and intervals
+    """
+    # first row of every key
+    offsets = np.concatenate(([0], np.cumsum(periods)))
+    rpis = np.empty(offsets[-1], dtype=RPI_DTYPE)
+    rpis["key_index"] = np.repeat(indexes, periods)
+    rpis["interval_number"] = np.repeat(starts - offsets[:-1], periods) + np.arange(
+        offsets[-1]
+    )
+
+    blocks = padded_data(rpis["interval_number"])
+    encrypted = rpis["rpi"]
+    for position in range(len(indexes)):
+        start, end = offsets[position], offsets[position + 1]
+        tek = key_data[position * KEY_LENGTH : (position + 1) * KEY_LENGTH]
+        encryptor = Cipher(
+            algorithms.AES(derive_rpik(tek)), modes.ECB(), backend=default_backend()
+        ).encryptor()
+        encrypted[start:end] = np.frombuffer(
+            encryptor.update(blocks[start:end].tobytes()), dtype=encrypted.dtype
+        )
+    return rpis
+
+
+def derive_rpis(keys: Iterable[TemporaryExposureKey]) -> np.ndarray:
+    """
+    RPIs of all intervals of every valid key (RPI_DTYPE), in order of keys and intervals
+    """
+    return derive_key_rpis(*key_columns(keys))
+
+
+def sort_order(rpis: np.ndarray, kind: str = "quicksort") -> np.ndarray:
+    """
+    Order sorting rpis by RPI bytes, stable kind is fast for merging already sorted runs
+    """
+    words = np.frombuffer(rpis["rpi"].tobytes(), dtype=">u8").reshape(-1, 2)
+    order = np.argsort(words[:, 0], kind=kind)
+    first = words[order, 0]
+    if np.any(first[1:] == first[:-1]):
+        # same first 8 bytes, practically only for duplicate keys
+        order = np.lexsort((words[:, 1], words[:, 0]))
+    return order
+
+
+def derive_shard(
+    shards_file: str,
+    row: int,
+    key_data: bytes,
+    indexes: np.ndarray,
+    starts: np.ndarray,
+    periods: np.ndarray,
+) -> float:
+    """
+    Derives RPIs of part of keys, sorts them and writes them to shards file from the row, returns seconds it took
+    """
+    started = time.process_time()
+    rpis = derive_key_rpis(key_data, indexes, starts, periods)
+    rpis = rpis[sort_order(rpis)]
+    shards = np.load(shards_file, mmap_mode="r+")
+    shards[row : row + len(rpis)] = rpis
+    shards.flush()
+    del shards
+    return time.process_time() - started
+
+
+def derive_rpis_sharded(
+    keys: Iterable[TemporaryExposureKey], rpis_file: str, workers: int = 1
+) -> dict:
+    """
+    Derives RPIs of keys in workers processes and saves them sorted by RPI to rpis_file (.npy).
+    Every worker derives one shard of keys and writes it sorted to its rows of memory mapped shards file,
+    the final merge of sorted shards is a stable sort which only merges the runs.
+    """
+    started = time.time()
+    key_data, indexes, starts, periods = key_columns(keys)
+    # rows of every key in shards file
+    offsets = np.concatenate(([0], np.cumsum(periods)))
+    bounds = np.linspace(0, len(indexes), max(workers, 1) + 1).astype(int)
+    shards_file = f"{rpis_file}.shards.npy"
+    np.lib.format.open_memmap(
+        shards_file, mode="w+", dtype=RPI_DTYPE, shape=(int(offsets[-1]),)
+    ).flush()
+    try:
+        arguments = [
+            (
+                shards_file,
+                offsets[start],
+                key_data[start * KEY_LENGTH : end * KEY_LENGTH],
+                indexes[start:end],
+                starts[start:end],
+                periods[start:end],
+            )
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        if workers <= 1:
+            worker_seconds = [
+                derive_shard(*shard_arguments) for shard_arguments in arguments
+            ]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                worker_seconds = list(executor.map(derive_shard, *zip(*arguments)))
+        derived = time.time()
+
+        shards = np.load(shards_file, mmap_mode="r")
+        rpis = np.lib.format.open_memmap(
+            rpis_file, mode="w+", dtype=RPI_DTYPE, shape=shards.shape
+        )
+        rpis[:] = shards[sort_order(shards, kind="stable")]
+        rpis.flush()
+        del rpis, shards
+    finally:
+        os.remove(shards_file)
+
+    elapsed = time.time() - started
+    worker_time = sum(worker_seconds)
+    return {
+        "keys": len(indexes),
+        "rpis": int(offsets[-1]),
+        "workers": workers,
+        "derive_seconds": round(derived - started, 3),
+        "merge_seconds": round(elapsed - (derived - started), 3),
+        "keys_per_second": int(len(indexes) / elapsed) if elapsed else 0,
+        "keys_per_second_per_core": (
+            int(len(indexes) / worker_time) if worker_time else 0
+        ),
+    }
+
+
+def save_rpis(file: BinaryIO, rpis: np.ndarray) -> None:
+    np.save(file, rpis, allow_pickle=False)
+
+
+def load_rpis(file: BinaryIO) -> np.ndarray:
+    return np.load(file, allow_pickle=False)
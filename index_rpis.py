@@ -0,0 +1,62 @@
+import os
+
+import click
+
+from decode_keys import EXPORT_FILE, stream_keys_from_file
+from exposure_keys.index import RPIFileIndex, content_hash
+
+
+@click.group()
+def index_rpis():
+    """
+    Keeps on-disk index of RPIs derived from exposure keys exports
+    """
+
+
+@click.command()
+@click.argument("index_dir", type=click.Path(file_okay=False))
+@click.argument("exports", type=click.Path(exists=True), nargs=-1)
+@click.option(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of processes deriving RPIs",
+)
+def update(index_dir, exports, workers):
+    """
+    Adds exports (zip files as published or directories with unzipped export.bin)
+    which are new or changed since the last update
+    """
+    index = RPIFileIndex(index_dir)
+    for export in exports:
+        if os.path.isdir(export):
+            batch = os.path.basename(os.path.normpath(export))
+            export = os.path.join(export, EXPORT_FILE)
+        else:
+            batch = os.path.splitext(os.path.basename(export))[0]
+        sha256 = content_hash(export)
+        if index.is_current(batch, sha256):
+            click.echo(f"{batch}: up to date")
+            continue
+        stats = index.add(batch, stream_keys_from_file(export), sha256, workers=workers)
+        click.echo(f"{batch}: {stats}")
+
+
+@click.command()
+@click.argument("index_dir", type=click.Path(exists=True, file_okay=False))
+@click.argument("rpis", nargs=-1)
+def find(index_dir, rpis):
+    """
+    Prints batch, key index and interval number of hex encoded RPIs (or EN service data)
+    """
+    index = RPIFileIndex(index_dir)
+    for rpi in rpis:
+        click.echo(f"{rpi}: {index.find(bytes.fromhex(rpi[:32]))}")
+
+
+index_rpis.add_command(update)
+index_rpis.add_command(find)
+
+
+if __name__ == "__main__":
+    index_rpis()
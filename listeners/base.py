@@ -1,12 +1,31 @@
 import abc
+from typing import TYPE_CHECKING, List
 
 from bluetooth.discovery.data import Encounter
 
+if TYPE_CHECKING:
+    from bluetooth.discovery.csv_chunks import EncounterColumns
+
 
 class EncounterListener(abc.ABC):
     @abc.abstractmethod
     def new_encounter(self, encounter: Encounter) -> None:
         pass
 
+    def new_encounters(self, encounters: List[Encounter]) -> None:
+        """
+        Encounters in the order they were seen, listeners can override it to process them at once
+        """
+        for encounter in encounters:
+            self.new_encounter(encounter=encounter)
+
+    def new_encounter_columns(self, columns: "EncounterColumns") -> None:
+        """
+        Chunk of encounters as arrays (csv-chunked backend), listeners can override it to process the arrays,
+        otherwise they get the encounters in batches
+        """
+        for batch in columns.batches():
+            self.new_encounters(encounters=batch)
+
     def cleanup(self):
         pass
@@ -1,10 +1,20 @@
+import sys
+from array import array
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Sequence
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from statistics import median
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Iterable, List, Optional, Union
 
 from bluetooth.discovery.data import Encounter
 
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = EPOCH.replace(tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+MIN_RSSI = -128
+MAX_RSSI = 127
+
 
 @dataclass(frozen=True)
 class Read:
@@ -13,51 +23,206 @@ class Read:
 
 
 @dataclass(frozen=True)
+class DeviceSummary:
+    key: str
+    service_data: str
+    first_seen: datetime
+    last_seen: datetime
+    reads: int
+    min_rssi: int
+    max_rssi: int
+    average_rssi: float
+
+    def to_csv(self) -> str:
+        return f"{self.key},{self.service_data},{self.first_seen.isoformat()},{self.last_seen.isoformat()},{self.reads},{self.min_rssi},{self.max_rssi},{self.average_rssi:.1f}\n"
+
+
+class Reads(Sequence):
+    """
+    Compact columnar storage of reads: microseconds since epoch and rssi in typed arrays.
+    Read objects are only created when items are accessed.
+    """
+
+    __slots__ = ("times", "rssis", "tzinfo")
+
+    def __init__(self, reads: Iterable[Read] = ()) -> None:
+        self.times = array("q")
+        self.rssis = array("b")
+        self.tzinfo = None
+        for read in reads:
+            self.append(read)
+
+    def append(self, read: Read) -> None:
+        if not self.times:
+            self.tzinfo = read.time.tzinfo
+        epoch = EPOCH if self.tzinfo is None else EPOCH_UTC
+        self.times.append((read.time - epoch) // MICROSECOND)
+        # sniffers never report anything outside of signed byte range in practice
+        self.rssis.append(min(max(read.rssi, MIN_RSSI), MAX_RSSI))
+
+    def time(self, index: int) -> datetime:
+        delta = timedelta(microseconds=self.times[index])
+        if self.tzinfo is None:
+            return EPOCH + delta
+        return (EPOCH_UTC + delta).astimezone(self.tzinfo)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Read, List[Read]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Read(time=self.time(index), rssi=self.rssis[index])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Reads):
+            return self.times == other.times and self.rssis == other.rssis
+        return list(self) == other
+
+    def __repr__(self) -> str:
+        return f"Reads({list(self)!r})"
+
+
 class Device:
+    """
+    Device seen by listeners, statistics are updated with every read so reading them is cheap
+    """
+
+    __slots__ = (
+        "key",
+        "service_data",
+        "reads",
+        "_first_rssis",
+        "_last_rssis",
+        "_gap_values",
+        "_gap_counts",
+    )
+
     AVERAGE_RSSI_READS = 5
     MINIMUM_GAP_BETWEEN_ENCOUNTERS = timedelta(milliseconds=10)
 
-    key: str
-    service_data: str
-    reads: List[Read]
+    def __init__(self, key: str, service_data: str, reads: Iterable[Read]) -> None:
+        self.key = key
+        self.service_data = service_data
+        self.reads = Reads()
+        # rssi of the first and the last AVERAGE_RSSI_READS reads
+        self._first_rssis: List[int] = []
+        self._last_rssis: Deque[int] = deque(maxlen=self.AVERAGE_RSSI_READS)
+        # histogram of gaps between reads for median: sorted distinct gaps (whole ms) and their counts,
+        # its size depends on how regular the device's advertising is, not on the number of reads
+        self._gap_values = array("q")
+        self._gap_counts = array("I")
+        for read in reads:
+            self.add_read(read)
+
+    def __repr__(self) -> str:
+        return f"Device(key={self.key!r}, service_data={self.service_data!r}, reads={self.reads!r})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Device):
+            return NotImplemented
+        return (self.key, self.service_data, self.reads) == (
+            other.key,
+            other.service_data,
+            other.reads,
+        )
+
+    @property
+    def first_time(self) -> Optional[datetime]:
+        if not self.reads:
+            return None
+        return self.reads.time(0)
 
     @property
-    def last_time(self) -> Optional[datetime.time]:
+    def last_time(self) -> Optional[datetime]:
         if not self.reads:
             return None
-        return self.reads[-1].time
+        return self.reads.time(-1)
 
     @property
     def last_average_rssi(self) -> Optional[int]:
         if not self.reads:
             return None
-        last_rssis = [r.rssi for r in self.reads[-self.AVERAGE_RSSI_READS :]]
-        return int(sum(last_rssis) / len(last_rssis))
+        return int(sum(self._last_rssis) / len(self._last_rssis))
 
     @property
     def first_average_rssi(self) -> Optional[int]:
         if not self.reads:
             return None
-        last_rssis = [r.rssi for r in self.reads[: self.AVERAGE_RSSI_READS]]
-        return int(sum(last_rssis) / len(last_rssis))
+        return int(sum(self._first_rssis) / len(self._first_rssis))
 
     @property
     def time_between(self) -> int:
-        times = [
-            (j.time - i.time).total_seconds() * 1000
-            for i, j in zip(self.reads[:-1], self.reads[1:])
-        ]
-        if times:
-            return int(median(times))
+        """
+        Median gap between reads in milliseconds
+        """
+        gaps = len(self.reads) - 1
+        if gaps < 1:
+            return 0
+        lower_rank, upper_rank = (gaps - 1) // 2, gaps // 2
+        lower = None
+        seen = 0
+        for value, count in zip(self._gap_values, self._gap_counts):
+            seen += count
+            if lower is None and seen > lower_rank:
+                lower = value
+            if seen > upper_rank:
+                return int((lower + value) / 2)
         return 0
 
     @property
     def presence(self) -> timedelta:
         if not self.reads:
             return timedelta()
-        first = self.reads[0]
-        last = self.reads[-1]
-        return last.time - first.time
+        return self.last_time - self.first_time
+
+    def summary(self) -> DeviceSummary:
+        rssis = self.reads.rssis
+        return DeviceSummary(
+            key=self.key,
+            service_data=self.service_data,
+            first_seen=self.first_time,
+            last_seen=self.last_time,
+            reads=len(self.reads),
+            min_rssi=min(rssis),
+            max_rssi=max(rssis),
+            average_rssi=sum(rssis) / len(rssis),
+        )
+
+    def memory_size(self) -> int:
+        """
+        Approximate number of bytes held by the device
+        """
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.reads)
+            + sys.getsizeof(self.reads.times)
+            + sys.getsizeof(self.reads.rssis)
+            + sys.getsizeof(self._first_rssis)
+            + sys.getsizeof(self._last_rssis)
+            + sys.getsizeof(self._gap_values)
+            + sys.getsizeof(self._gap_counts)
+        )
+
+    def add_gap(self, gap: int) -> None:
+        values = self._gap_values
+        index = bisect_left(values, gap)
+        if index < len(values) and values[index] == gap:
+            self._gap_counts[index] += 1
+        else:
+            values.insert(index, gap)
+            self._gap_counts.insert(index, 1)
+
+    def add_read(self, read: Read) -> None:
+        self.reads.append(read)
+        times = self.reads.times
+        if len(times) > 1:
+            # microseconds to whole milliseconds
+            self.add_gap((times[-1] - times[-2]) // 1000)
+        rssi = self.reads.rssis[-1]
+        if len(self._first_rssis) < self.AVERAGE_RSSI_READS:
+            self._first_rssis.append(rssi)
+        self._last_rssis.append(rssi)
 
     def add_encounter(self, encounter: Encounter):
         if (
@@ -66,4 +231,40 @@ class Device:
         ):
             # too short time between encounters is just some channel hopping issue
             return
-        self.reads.append(Read(rssi=encounter.rssi, time=encounter.time))
+        self.add_read(Read(rssi=encounter.rssi, time=encounter.time))
+
+
+if __name__ == "__main__":
+    import random
+    import tracemalloc
+
+    def measure(label, make):
+        tracemalloc.start()
+        kept = make()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label}: {size / reads_count:.1f} bytes per read")
+        return kept
+
+    devices_count = 100
+    reads_per_device = 2000
+    reads_count = devices_count * reads_per_device
+    start = datetime.now()
+
+    def encounters(device_index):
+        time = start
+        for _ in range(reads_per_device):
+            time += timedelta(milliseconds=random.randint(200, 300))
+            yield Read(time=time, rssi=random.randint(-100, -30))
+
+    def list_devices():
+        return [list(encounters(i)) for i in range(devices_count)]
+
+    def compact_devices():
+        return [
+            Device(key=f"{i:012x}", service_data="", reads=encounters(i))
+            for i in range(devices_count)
+        ]
+
+    measure("list of Read", list_devices)
+    measure("Device", compact_devices)
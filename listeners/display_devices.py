@@ -1,46 +1,170 @@
 import curses
-from typing import Iterable
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from bluetooth.discovery.data import Encounter
-from listeners.data import Device
+from listeners.data import Device, DeviceSummary
 from listeners.base import EncounterListener
+from listeners.expiry import DeviceExpiry
+
+DeviceKey = Tuple[str, str]
 
 
 class CursesDisplayDevicesListener(EncounterListener):
     """
-    Listener which just nicely prints seen devices
+    Listener which just nicely prints seen devices.
+    Screen is drawn from its own thread at most frame_rate times per second and only changed rows are redrawn,
+    the list can be scrolled with arrows, PgUp/PgDn, Home and End.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        device_ttl: Optional[timedelta] = None,
+        on_evict: Optional[Callable[[DeviceSummary], None]] = None,
+        frame_rate: float = 10,
+    ):
         self.stdscr = curses.initscr()
         curses.noecho()
         curses.cbreak()
-        self.devices_dict = {}
-
-    def print_devices(self, devices_list: Iterable[Device]) -> None:
-        devices_list = sorted(devices_list, key=lambda d: d.key)
-        for index, device in enumerate(devices_list):
-            last_read = device.reads[-1]
-            first_read = device.reads[0]
-            self.stdscr.addstr(
-                index,
-                0,
-                f"{device.key} ({device.service_data}): {last_read.rssi} (avg {device.last_average_rssi}) (last: {last_read.time}, first: {first_read.time}, reads: {len(device.reads)}, interval: {device.time_between}, present {device.presence})",
-            )
+        self.stdscr.keypad(True)
+        self.stdscr.timeout(int(1000 / frame_rate))
+        self.devices_dict: Dict[DeviceKey, Device] = {}
+        self.expiry = DeviceExpiry(self.devices_dict, ttl=device_ttl, on_evict=on_evict)
+        # devices in display order
+        self.sorted_keys: List[DeviceKey] = []
+        # devices changed since the last frame and whether rows moved
+        self.changed: Set[DeviceKey] = set()
+        self.moved = True
+        self.lock = threading.Lock()
+        self.top = 0
+        self.lines: List[str] = []
+        self.closing = threading.Event()
+        self.renderer = threading.Thread(
+            target=self.render, name="curses renderer", daemon=True
+        )
+        self.renderer.start()
+
+    def device_stats(self) -> dict:
+        return self.expiry.stats()
+
+    def format_device(self, device: Device) -> str:
+        last_read = device.reads[-1]
+        first_read = device.reads[0]
+        return f"{device.key} ({device.service_data}): {last_read.rssi} (avg {device.last_average_rssi}) (last: {last_read.time}, first: {first_read.time}, reads: {len(device.reads)}, interval: {device.time_between}, present {device.presence})"
+
+    def scroll(self, key: int, rows: int) -> None:
+        top = self.top
+        if key == curses.KEY_UP:
+            top -= 1
+        elif key == curses.KEY_DOWN:
+            top += 1
+        elif key == curses.KEY_PPAGE:
+            top -= rows
+        elif key == curses.KEY_NPAGE:
+            top += rows
+        elif key == curses.KEY_HOME:
+            top = 0
+        elif key == curses.KEY_END:
+            top = len(self.sorted_keys)
+        top = max(min(top, len(self.sorted_keys) - rows), 0)
+        if top != self.top:
+            self.top = top
+            self.moved = True
+
+    def frame(self, rows: int) -> List[Optional[str]]:
+        """
+        Text of visible rows, None for rows which did not change since the last frame
+        """
+        with self.lock:
+            visible = self.sorted_keys[self.top : self.top + rows]
+            if self.moved:
+                lines = [self.format_device(self.devices_dict[key]) for key in visible]
+            else:
+                lines = [
+                    (
+                        self.format_device(self.devices_dict[key])
+                        if key in self.changed
+                        else None
+                    )
+                    for key in visible
+                ]
+            self.changed.clear()
+            self.moved = False
+            status = f"devices: {len(self.sorted_keys)}, showing {self.top + 1}-{self.top + len(visible)}"
+        return lines + [""] * (rows - len(lines)) + [status]
+
+    def draw(self, lines: List[Optional[str]], width: int) -> None:
+        self.lines.extend([""] * (len(lines) - len(self.lines)))
+        for index, line in enumerate(lines):
+            if line is None or line == self.lines[index]:
+                continue
+            # writing to the last column of the last row fails
+            self.stdscr.addnstr(index, 0, line, width - 1)
+            self.stdscr.clrtoeol()
+            self.lines[index] = line
         self.stdscr.refresh()
 
-    def new_encounter(self, encounter: Encounter) -> None:
+    def render(self) -> None:
+        while not self.closing.is_set():
+            height, width = self.stdscr.getmaxyx()
+            # the last row shows status
+            rows = max(height - 1, 0)
+            # waits for a key for at most one frame
+            key = self.stdscr.getch()
+            if key == curses.KEY_RESIZE:
+                self.stdscr.clear()
+                self.redraw()
+                continue
+            with self.lock:
+                self.scroll(key, rows)
+            try:
+                self.draw(self.frame(rows), width)
+            except curses.error:
+                # terminal was resized while drawing
+                self.redraw()
+
+    def redraw(self) -> None:
+        self.lines = []
+        with self.lock:
+            self.moved = True
+
+    def remove(self, key: DeviceKey) -> None:
+        del self.sorted_keys[bisect_left(self.sorted_keys, key)]
+        self.changed.discard(key)
+        self.moved = True
+
+    def add_encounter(self, encounter: Encounter) -> None:
+        key = (encounter.device_key, encounter.service_data)
+        for evicted_key, _ in self.expiry.expire(encounter.time):
+            self.remove(evicted_key)
         try:
-            device = self.devices_dict[(encounter.device_key, encounter.service_data)]
+            device = self.devices_dict[key]
         except KeyError:
             device = Device(
                 key=encounter.device_key, service_data=encounter.service_data, reads=[]
             )
-            self.devices_dict[(encounter.device_key, encounter.service_data)] = device
+            self.devices_dict[key] = device
+            self.expiry.schedule(key, device, encounter.time)
+            insort(self.sorted_keys, key)
+            self.moved = True
         device.add_encounter(encounter=encounter)
-        self.print_devices(self.devices_dict.values())
+        self.changed.add(key)
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        with self.lock:
+            self.add_encounter(encounter)
+
+    def new_encounters(self, encounters: List[Encounter]) -> None:
+        # renderer waits for the whole batch
+        with self.lock:
+            for encounter in encounters:
+                self.add_encounter(encounter)
 
     def cleanup(self):
+        self.closing.set()
+        self.renderer.join()
         curses.echo()
         curses.nocbreak()
         curses.endwin()
@@ -0,0 +1,124 @@
+import math
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from listeners.data import Device, DeviceSummary
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel: items are put into slot of their deadline and handed out once the wheel passes it.
+    Scheduling is O(1) and every item is visited once per revolution of the wheel.
+    """
+
+    def __init__(self, resolution: timedelta, slots: int) -> None:
+        self.resolution = resolution
+        self.slots: List[List[Tuple[int, Any]]] = [[] for _ in range(slots)]
+        self.origin: Optional[datetime] = None
+        self.tick = 0
+        self.size = 0
+
+    def ticks(self, time: datetime) -> int:
+        if self.origin is None:
+            self.origin = time
+        return (time - self.origin) // self.resolution
+
+    def schedule(self, deadline: datetime, item: Any) -> None:
+        # slot of the current tick was already visited
+        tick = max(self.ticks(deadline), self.tick + 1)
+        self.slots[tick % len(self.slots)].append((tick, item))
+        self.size += 1
+
+    def advance(self, now: datetime) -> List[Any]:
+        """
+        Moves the wheel to now and returns items whose deadline has passed
+        """
+        now_tick = self.ticks(now)
+        if now_tick <= self.tick:
+            return []
+        expired = []
+        first_tick = max(self.tick + 1, now_tick - len(self.slots) + 1)
+        for tick in range(first_tick, now_tick + 1):
+            index = tick % len(self.slots)
+            slot = self.slots[index]
+            if not slot:
+                continue
+            pending = []
+            for deadline, item in slot:
+                if deadline <= now_tick:
+                    expired.append(item)
+                else:
+                    pending.append((deadline, item))
+            self.slots[index] = pending
+        self.tick = now_tick
+        self.size -= len(expired)
+        return expired
+
+
+class DeviceExpiry:
+    """
+    Evicts devices not seen for ttl from listener's devices dict, time is driven by encounters.
+    Every evicted device is passed to on_evict as DeviceSummary.
+    """
+
+    RESOLUTION = timedelta(seconds=1)
+
+    def __init__(
+        self,
+        devices_dict: Dict[Hashable, Device],
+        ttl: Optional[timedelta] = None,
+        on_evict: Optional[Callable[[DeviceSummary], None]] = None,
+        on_remove: Optional[Callable[[Hashable, Device], None]] = None,
+    ) -> None:
+        self.devices_dict = devices_dict
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # lets listener update its own indexes before the next device is evicted
+        self.on_remove = on_remove
+        self.evicted = 0
+        self.wheel = None
+        if ttl is not None:
+            # wheel spans whole ttl, so device is visited only once per ttl
+            self.wheel = TimingWheel(
+                resolution=self.RESOLUTION, slots=math.ceil(ttl / self.RESOLUTION) + 1
+            )
+
+    def schedule(self, key: Hashable, device: Device, seen: datetime) -> None:
+        """
+        Starts tracking new device, later reads are noticed when its deadline comes
+        """
+        if self.wheel is not None:
+            self.wheel.schedule(seen + self.ttl, (key, device))
+
+    def expire(self, now: datetime) -> List[Tuple[Hashable, Device]]:
+        """
+        Removes devices not seen for ttl before now and returns them
+        """
+        if self.wheel is None:
+            return []
+        evicted = []
+        for key, device in self.wheel.advance(now):
+            if self.devices_dict.get(key) is not device:
+                # already removed by the listener
+                continue
+            deadline = device.last_time + self.ttl
+            if deadline > now:
+                self.wheel.schedule(deadline, (key, device))
+                continue
+            del self.devices_dict[key]
+            evicted.append((key, device))
+            if self.on_remove:
+                self.on_remove(key, device)
+            if self.on_evict:
+                self.on_evict(device.summary())
+        self.evicted += len(evicted)
+        return evicted
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self.devices_dict),
+            "evicted": self.evicted,
+            "memory": sum(
+                device.memory_size() for device in self.devices_dict.values()
+            ),
+        }
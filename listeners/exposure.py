@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bluetooth.discovery.data import Encounter
+from exposure_keys.index import RPIHashIndex
+from exposure_keys.keys_pb2 import TemporaryExposureKey
+from exposure_keys.rpi import RPI_LENGTH, derive_rpis, interval_number
+from listeners.base import EncounterListener
+from listeners.data import Device, DeviceSummary
+from listeners.expiry import DeviceExpiry
+
+DeviceKey = Tuple[str, str]
+
+
+@dataclass(frozen=True)
+class ExposureMatch:
+    export: int
+    key_index: int
+    interval_number: int
+    device: DeviceSummary
+
+    @property
+    def duration(self) -> timedelta:
+        return self.device.last_seen - self.device.first_seen
+
+    def __str__(self) -> str:
+        device = self.device
+        return f"{device.first_seen}: exposure to key {self.key_index} of export {self.export} by {device.key} ({device.service_data}) for {self.duration}, reads: {device.reads}, rssi min {device.min_rssi} max {device.max_rssi} avg {device.average_rssi:.1f}"
+
+
+class ExposureListener(EncounterListener):
+    """
+    Listener matching RPIs broadcasted by seen devices against RPIs derived from exposure keys exports,
+    keys of every export can be any iterable (e.g. streamed by decode_keys.stream_keys_from_file).
+    Exposure ends when matching device was not seen for EXPOSURE_GAP, then (or on cleanup) it is passed to on_match.
+    RPI is accepted only within INTERVAL_TOLERANCE intervals of when it was supposed to be broadcasted.
+    """
+
+    EXPOSURE_GAP = timedelta(seconds=20)
+    # +-2 hours as in Exposure Notification specification
+    INTERVAL_TOLERANCE = 12
+
+    def __init__(
+        self,
+        exports: Sequence[Iterable[TemporaryExposureKey]],
+        on_match: Optional[Callable[[ExposureMatch], None]] = None,
+    ) -> None:
+        rpis = [derive_rpis(keys) for keys in exports]
+        # first row of every export
+        self.offsets = np.cumsum([0] + [len(export_rpis) for export_rpis in rpis])
+        self.rpis = np.concatenate(rpis) if rpis else derive_rpis([])
+        self.index = RPIHashIndex(self.rpis)
+        self.on_match = on_match or print
+        # devices matching some RPI and their rows in rpis
+        self.devices_dict: Dict[DeviceKey, Device] = {}
+        self.rows: Dict[DeviceKey, int] = {}
+        self.expiry = DeviceExpiry(
+            self.devices_dict, ttl=self.EXPOSURE_GAP, on_remove=self.end_exposure
+        )
+        self.encounters = 0
+        self.matched_encounters = 0
+        self.exposures = 0
+
+    def stats(self) -> dict:
+        return {
+            "rpis": len(self.index),
+            "encounters": self.encounters,
+            "matched_encounters": self.matched_encounters,
+            "exposures": self.exposures,
+        }
+
+    def device_stats(self) -> dict:
+        return self.expiry.stats()
+
+    def find(self, encounter: Encounter) -> Optional[int]:
+        try:
+            rpi = bytes.fromhex(encounter.service_data[: 2 * RPI_LENGTH])
+        except ValueError:
+            # not EN service data
+            return None
+        row = self.index.find(rpi)
+        if row is None:
+            return None
+        rpi_interval = self.rpis["interval_number"].item(row)
+        if (
+            abs(interval_number(encounter.time) - rpi_interval)
+            > self.INTERVAL_TOLERANCE
+        ):
+            return None
+        return row
+
+    def end_exposure(self, key: DeviceKey, device: Device) -> None:
+        row = self.rows.pop(key)
+        self.exposures += 1
+        self.on_match(
+            ExposureMatch(
+                export=int(np.searchsorted(self.offsets, row, side="right")) - 1,
+                key_index=self.rpis["key_index"].item(row),
+                interval_number=self.rpis["interval_number"].item(row),
+                device=device.summary(),
+            )
+        )
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        self.encounters += 1
+        self.expiry.expire(encounter.time)
+        key = (encounter.device_key, encounter.service_data)
+        device = self.devices_dict.get(key)
+        if device is None:
+            row = self.find(encounter)
+            if row is None:
+                return
+            device = Device(
+                key=encounter.device_key, service_data=encounter.service_data, reads=[]
+            )
+            self.devices_dict[key] = device
+            self.rows[key] = row
+            self.expiry.schedule(key, device, encounter.time)
+        self.matched_encounters += 1
+        device.add_encounter(encounter=encounter)
+
+    def cleanup(self):
+        for key, device in list(self.devices_dict.items()):
+            del self.devices_dict[key]
+            self.end_exposure(key, device)
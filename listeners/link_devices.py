@@ -1,8 +1,16 @@
-from datetime import timedelta
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from bluetooth.discovery.data import Encounter
-from listeners.data import Device
+from listeners.data import Device, DeviceSummary
 from listeners.base import EncounterListener
+from listeners.expiry import DeviceExpiry
+
+DeviceKey = Tuple[str, str]
+# (time, order in which device was first seen, device key)
+IndexEntry = Tuple[datetime, int, DeviceKey]
 
 
 class LinkDevicesListener(EncounterListener):
@@ -16,48 +24,179 @@ class LinkDevicesListener(EncounterListener):
     INACTIVE_DEVICE = timedelta(seconds=20)
     TOO_LONG_GAP = timedelta(seconds=20)
 
-    def __init__(self):
-        self.devices_dict = {}
+    def __init__(
+        self,
+        device_ttl: Optional[timedelta] = None,
+        on_evict: Optional[Callable[[DeviceSummary], None]] = None,
+    ):
+        self.devices_dict: Dict[DeviceKey, Device] = {}
+        self.expiry = DeviceExpiry(
+            self.devices_dict,
+            ttl=device_ttl,
+            on_evict=on_evict,
+            on_remove=self.forget_device,
+        )
+        # position of the device in devices_dict, the first matching new device is linked
+        self.order: Dict[DeviceKey, int] = {}
+        self.next_order = 0
+        # all devices sorted by the first read time
+        self.by_first_time: List[IndexEntry] = []
+        # heap of devices which were active, by (possibly outdated) last read time
+        self.active: List[IndexEntry] = []
+        # devices which stopped broadcasting, sorted by the last read time
+        self.inactive: List[IndexEntry] = []
+        # inactive device -> the first device it could be linked to
+        self.links: Dict[DeviceKey, DeviceKey] = {}
+        self.linked_from: Dict[DeviceKey, Set[DeviceKey]] = {}
+
+    def device_stats(self) -> dict:
+        return self.expiry.stats()
+
+    def entry(self, key: DeviceKey, time: datetime) -> IndexEntry:
+        return time, self.order[key], key
+
+    def can_link(self, old_device: Device, device: Device) -> bool:
+        time_diff = device.first_time - old_device.last_time
+        return (
+            timedelta() <= time_diff <= self.TOO_LONG_GAP
+            and abs(old_device.last_average_rssi - device.first_average_rssi)
+            <= self.RSSI_THRESHOLD
+        )
+
+    def find_link(self, old_key: DeviceKey) -> Optional[DeviceKey]:
+        old_device = self.devices_dict[old_key]
+        start = bisect_left(self.by_first_time, (old_device.last_time,))
+        stop = bisect_right(
+            self.by_first_time,
+            (old_device.last_time + self.TOO_LONG_GAP, self.next_order),
+        )
+        link = None
+        for _, order, key in self.by_first_time[start:stop]:
+            if (link is None or order < self.order[link]) and self.can_link(
+                old_device, self.devices_dict[key]
+            ):
+                link = key
+        return link
+
+    def set_link(self, old_key: DeviceKey, key: Optional[DeviceKey]) -> None:
+        self.forget_link(old_key)
+        if key is not None:
+            self.links[old_key] = key
+            self.linked_from.setdefault(key, set()).add(old_key)
+
+    def forget_link(self, old_key: DeviceKey) -> None:
+        key = self.links.pop(old_key, None)
+        if key is not None:
+            self.linked_from[key].discard(old_key)
+            if not self.linked_from[key]:
+                del self.linked_from[key]
+
+    def relink_to(self, key: DeviceKey) -> None:
+        """
+        Re-evaluates links to the device when its first reads changed
+        """
+        for old_key in list(self.linked_from.get(key, ())):
+            self.set_link(old_key, self.find_link(old_key))
+
+        device = self.devices_dict[key]
+        start = bisect_left(self.inactive, (device.first_time - self.TOO_LONG_GAP,))
+        stop = bisect_right(self.inactive, (device.first_time, self.next_order))
+        for _, _, old_key in self.inactive[start:stop]:
+            link = self.links.get(old_key)
+            if link is not None and self.order[link] < self.order[key]:
+                continue
+            if self.can_link(self.devices_dict[old_key], device):
+                self.set_link(old_key, key)
+
+    def deactivate(self, time: datetime) -> None:
+        while self.active and self.active[0][0] <= time - self.INACTIVE_DEVICE:
+            last_time, order, key = heapq.heappop(self.active)
+            device = self.devices_dict.get(key)
+            if device is None or self.order[key] != order:
+                continue
+            if device.last_time > last_time:
+                # seen since it was scheduled
+                heapq.heappush(self.active, self.entry(key, device.last_time))
+                continue
+            insort(self.inactive, self.entry(key, last_time))
+            self.set_link(key, self.find_link(key))
+
+    def remove(self, key: DeviceKey, index: List[IndexEntry], time: datetime) -> None:
+        del index[bisect_left(index, self.entry(key, time))]
+
+    def delete_device(self, key: DeviceKey) -> None:
+        self.forget_device(key, self.devices_dict.pop(key))
+
+    def forget_device(self, key: DeviceKey, device: Device) -> None:
+        """
+        Removes device which is no longer in devices_dict from indexes
+        """
+        if self.is_inactive(key, device.last_time):
+            self.remove(key, self.inactive, device.last_time)
+        self.remove(key, self.by_first_time, device.first_time)
+        self.forget_link(key)
+        for old_key in list(self.linked_from.get(key, ())):
+            self.set_link(old_key, self.find_link(old_key))
+        del self.order[key]
 
     def link_devices(self, encounter: Encounter) -> None:
+        self.deactivate(encounter.time)
+
         device_to_delete = None
-        for old_device in self.devices_dict.values():
+        # encounters may come slightly out of order, so inactivity is checked against this one
+        for old_key in sorted(self.links, key=self.order.__getitem__):
+            old_device = self.devices_dict[old_key]
             if encounter.time - old_device.last_time < self.INACTIVE_DEVICE:
                 continue
 
-            # we rely on fact that python dict maintains insertion order so we will always link the first new device
-            for device in self.devices_dict.values():
-                first_read = device.reads[0]
-                if first_read.time < old_device.last_time:
-                    continue
-
-                time_diff = first_read.time - old_device.last_time
-                if time_diff > self.TOO_LONG_GAP:
-                    continue
-
-                if (
-                    abs(old_device.last_average_rssi - device.first_average_rssi)
-                    > self.RSSI_THRESHOLD
-                ):
-                    continue
-
-                device_to_delete = old_device
-                print(
-                    f"{first_read.time}: {old_device.key} ({old_device.service_data}) is now {device.key} ({device.service_data}) after gap of {int(time_diff.total_seconds() * 1000)}ms, device was present for {old_device.presence}"
-                )
-                # do no more matching on the old device as it should be removed
-                break
+            device = self.devices_dict[self.links[old_key]]
+            first_read = device.reads[0]
+            time_diff = first_read.time - old_device.last_time
+            device_to_delete = old_key
+            print(
+                f"{first_read.time}: {old_device.key} ({old_device.service_data}) is now {device.key} ({device.service_data}) after gap of {int(time_diff.total_seconds() * 1000)}ms, device was present for {old_device.presence}"
+            )
 
         if device_to_delete:
-            del self.devices_dict[(device_to_delete.key, device_to_delete.service_data)]
+            self.delete_device(device_to_delete)
+
+    def new_encounters(self, encounters: List[Encounter]) -> None:
+        # linking is decided after every encounter, batch only saves calls
+        new_encounter = self.new_encounter
+        for encounter in encounters:
+            new_encounter(encounter)
 
     def new_encounter(self, encounter: Encounter) -> None:
+        self.expiry.expire(encounter.time)
+        key = (encounter.device_key, encounter.service_data)
         try:
-            device = self.devices_dict[(encounter.device_key, encounter.service_data)]
+            device = self.devices_dict[key]
         except KeyError:
             device = Device(
                 key=encounter.device_key, service_data=encounter.service_data, reads=[]
             )
-            self.devices_dict[(encounter.device_key, encounter.service_data)] = device
+            self.devices_dict[key] = device
+            self.order[key] = self.next_order
+            self.next_order += 1
+            self.expiry.schedule(key, device, encounter.time)
+
+        reads = len(device.reads)
+        last_time = device.last_time
         device.add_encounter(encounter=encounter)
+        if len(device.reads) > reads:
+            if not reads:
+                insort(self.by_first_time, self.entry(key, device.first_time))
+                heapq.heappush(self.active, self.entry(key, device.last_time))
+            elif self.is_inactive(key, last_time):
+                self.remove(key, self.inactive, last_time)
+                self.forget_link(key)
+                heapq.heappush(self.active, self.entry(key, device.last_time))
+            if len(device.reads) <= Device.AVERAGE_RSSI_READS:
+                # first average rssi changed
+                self.relink_to(key)
         self.link_devices(encounter=encounter)
+
+    def is_inactive(self, key: DeviceKey, last_time: datetime) -> bool:
+        entry = self.entry(key, last_time)
+        index = bisect_left(self.inactive, entry)
+        return index < len(self.inactive) and self.inactive[index] == entry
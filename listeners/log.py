@@ -1,8 +1,109 @@
-from typing import Optional, TextIO
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import BinaryIO, Callable, List, Optional, TextIO
 
+from bluetooth.discovery.csv import encounter_to_csv
 from bluetooth.discovery.data import Encounter
-from listeners.data import Device
+from bluetooth.discovery.encounter_log import EncounterLogWriter
+from listeners.data import Device, DeviceSummary
 from listeners.base import EncounterListener
+from listeners.expiry import DeviceExpiry
+
+FSYNC_NONE = "none"
+FSYNC_INTERVAL = "interval"
+FSYNC_ALWAYS = "always"
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_INTERVAL, FSYNC_ALWAYS)
+
+
+class LogWriter:
+    """
+    Collects lines in memory and writes them to the file in one go when buffer_size bytes are collected
+    or flush_interval seconds passed (checked also from background thread, so idle log gets flushed too).
+    fsync policy:
+     - none: data is left to the OS to write to the disk
+     - interval: fsync after every flush
+     - always: every write (single line or whole batch of encounters) is written, flushed and fsynced right away
+    """
+
+    def __init__(
+        self,
+        file: TextIO,
+        buffer_size: int = 64 * 1024,
+        flush_interval: float = 1.0,
+        fsync: str = FSYNC_NONE,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy {fsync}")
+        self.file = file
+        self.encoding = getattr(file, "encoding", None) or "utf-8"
+        self.buffer_size = 0 if fsync == FSYNC_ALWAYS else buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.lock = threading.Lock()
+        self.lines = 0
+        self.bytes = 0
+        self.flushes = 0
+        self.write_time = 0.0
+        self.started = time.time()
+        self.last_flush = self.started
+        self.closing = threading.Event()
+        self.flusher = threading.Thread(
+            target=self.run, name=f"{getattr(file, 'name', 'log')} flusher", daemon=True
+        )
+        self.flusher.start()
+
+    def write(self, line: str, lines: int = 1) -> None:
+        with self.lock:
+            self.buffer.append(line)
+            # bytes are counted as they end up in the file
+            self.buffered += len(line.encode(self.encoding))
+            self.lines += lines
+            if self.buffered >= self.buffer_size:
+                self._flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.last_flush = time.time()
+        if not self.buffer:
+            return
+        data = "".join(self.buffer)
+        self.bytes += self.buffered
+        self.buffer = []
+        self.buffered = 0
+        self.file.write(data)
+        self.file.flush()
+        if self.fsync != FSYNC_NONE:
+            os.fsync(self.file.fileno())
+        self.flushes += 1
+        self.write_time += time.time() - self.last_flush
+
+    def run(self) -> None:
+        while not self.closing.wait(self.flush_interval / 2):
+            if time.time() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def close(self) -> None:
+        self.closing.set()
+        self.flusher.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        elapsed = time.time() - self.started
+        return {
+            "file": getattr(self.file, "name", None),
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "flushes": self.flushes,
+            "bytes_per_second": int(self.bytes / elapsed) if elapsed else 0,
+            "write_seconds": round(self.write_time, 3),
+        }
 
 
 class LogListener(EncounterListener):
@@ -11,28 +112,109 @@ class LogListener(EncounterListener):
     """
 
     def __init__(
-        self, devices_log: Optional[TextIO], encounters_log: Optional[TextIO]
+        self,
+        devices_log: Optional[TextIO],
+        encounters_log: Optional[TextIO],
+        device_ttl: Optional[timedelta] = None,
+        on_evict: Optional[Callable[[DeviceSummary], None]] = None,
+        buffer_size: int = 64 * 1024,
+        flush_interval: float = 1.0,
+        fsync: str = FSYNC_NONE,
     ) -> None:
         self.devices_dict = {}
-        self.devices_log = devices_log
-        self.encounters_log = encounters_log
+        self.devices_log = (
+            LogWriter(
+                devices_log,
+                buffer_size=buffer_size,
+                flush_interval=flush_interval,
+                fsync=fsync,
+            )
+            if devices_log
+            else None
+        )
+        self.encounters_log = (
+            LogWriter(
+                encounters_log,
+                buffer_size=buffer_size,
+                flush_interval=flush_interval,
+                fsync=fsync,
+            )
+            if encounters_log
+            else None
+        )
+        self.expiry = DeviceExpiry(self.devices_dict, ttl=device_ttl, on_evict=on_evict)
 
-    def new_encounter(self, encounter: Encounter) -> None:
+    def device_stats(self) -> dict:
+        return self.expiry.stats()
+
+    def log_stats(self) -> List[dict]:
+        return [log.stats() for log in (self.devices_log, self.encounters_log) if log]
+
+    def new_encounters(self, encounters: List[Encounter]) -> None:
         if self.encounters_log:
             self.encounters_log.write(
-                f"{encounter.time.isoformat()},{encounter.device_key},{encounter.service_data},{encounter.rssi}\n"
+                "".join([encounter_to_csv(encounter) for encounter in encounters]),
+                lines=len(encounters),
             )
-            self.encounters_log.flush()
+        for encounter in encounters:
+            self.add_device(encounter)
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        if self.encounters_log:
+            self.encounters_log.write(encounter_to_csv(encounter))
+        self.add_device(encounter)
 
-        if (encounter.device_key, encounter.service_data) in self.devices_dict:
+    def add_device(self, encounter: Encounter) -> None:
+        self.expiry.expire(encounter.time)
+        device = self.devices_dict.get((encounter.device_key, encounter.service_data))
+        if device is not None:
+            if self.expiry.ttl is not None:
+                # reads are only needed to know when device was last seen
+                device.add_encounter(encounter=encounter)
             return
 
         device = Device(
             key=encounter.device_key, service_data=encounter.service_data, reads=[]
         )
         self.devices_dict[(encounter.device_key, encounter.service_data)] = device
+        device.add_encounter(encounter=encounter)
+        self.expiry.schedule(
+            (encounter.device_key, encounter.service_data), device, encounter.time
+        )
         if self.devices_log:
             self.devices_log.write(
                 f"{encounter.time.isoformat()},{device.key},{device.service_data},{encounter.rssi}\n"
             )
-            self.devices_log.flush()
+
+    def cleanup(self):
+        for log in (self.devices_log, self.encounters_log):
+            if log:
+                log.close()
+
+
+class EncounterLogListener(EncounterListener):
+    """
+    Listener which logs encounters to the binary encounter log, blocks are written when full or every flush_interval
+    """
+
+    def __init__(self, binary_log: BinaryIO, flush_interval: float = 1.0) -> None:
+        self.writer = EncounterLogWriter(binary_log)
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        self.writer.write(encounter)
+        self.flush_if_due()
+
+    def new_encounters(self, encounters: List[Encounter]) -> None:
+        for encounter in encounters:
+            self.writer.write(encounter)
+        self.flush_if_due()
+
+    def flush_if_due(self) -> None:
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.writer.flush()
+            self.last_flush = time.time()
+
+    def cleanup(self):
+        self.writer.close()
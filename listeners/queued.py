@@ -0,0 +1,120 @@
+import logging
+import threading
+from collections import deque
+from typing import List
+
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+class QueuedListener(EncounterListener):
+    """
+    Listener passing encounters to the wrapped listener from its own thread through a bounded queue,
+    so discovery backend never waits for a slow listener (unless overflow policy is to block)
+    """
+
+    def __init__(
+        self,
+        listener: EncounterListener,
+        max_size: int = 10000,
+        overflow: str = BLOCK,
+        max_batch: int = 1024,
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow}")
+        if max_size < 1:
+            raise ValueError("queue needs to hold at least one encounter")
+        self.listener = listener
+        self.max_size = max_size
+        self.overflow = overflow
+        # encounters taken from the queue and passed to the listener at once
+        self.max_batch = max_batch
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.closing = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.worker = threading.Thread(
+            target=self.run, name=f"{type(listener).__name__} worker", daemon=True
+        )
+        self.worker.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.queue)
+
+    def stats(self) -> dict:
+        return {
+            "listener": type(self.listener).__name__,
+            "queue_depth": self.queue_depth,
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        with self.lock:
+            self.put(encounter)
+
+    def new_encounters(self, encounters: List[Encounter]) -> None:
+        with self.lock:
+            for encounter in encounters:
+                self.put(encounter)
+
+    def put(self, encounter: Encounter) -> None:
+        self.received += 1
+        if len(self.queue) >= self.max_size:
+            if self.overflow == DROP_NEWEST:
+                self.dropped += 1
+                return
+            if self.overflow == DROP_OLDEST:
+                self.queue.popleft()
+                self.dropped += 1
+            else:
+                while len(self.queue) >= self.max_size and not self.closing:
+                    self.not_full.wait()
+        self.queue.append(encounter)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.not_empty.notify()
+
+    def run(self) -> None:
+        while True:
+            with self.lock:
+                while not self.queue and not self.closing:
+                    self.not_empty.wait()
+                if not self.queue:
+                    # closing and everything was passed on
+                    return
+                encounters = [
+                    self.queue.popleft()
+                    for _ in range(min(len(self.queue), self.max_batch))
+                ]
+                self.not_full.notify_all()
+            try:
+                self.listener.new_encounters(encounters=encounters)
+            except Exception:
+                # the whole batch is lost, so all of its encounters are counted as errors
+                self.errors += len(encounters)
+                logging.exception("listener failed to process encounters")
+            else:
+                self.processed += len(encounters)
+
+    def cleanup(self):
+        with self.lock:
+            self.closing = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+        self.worker.join()
+        self.listener.cleanup()
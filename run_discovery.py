@@ -1,18 +1,58 @@
+import signal
+import sys
+from datetime import timedelta
+
 import click
 
-from bluetooth.discovery.core_bluetooth import CoreBluetoothDiscovery
 from bluetooth.discovery.csv import CSVDiscovery
-from bluetooth.discovery.nrf import NRFBluetoothDiscovery
+from bluetooth.discovery.encounter_log import EncounterLogDiscovery
+from bluetooth.discovery.nrf import MultiNRFBluetoothDiscovery, NRFBluetoothDiscovery
+from bluetooth.discovery.pcap import PcapDiscovery
+from decode_keys import stream_keys_from_file
 from listeners.display_devices import CursesDisplayDevicesListener
 from listeners.link_devices import LinkDevicesListener
-from listeners.log import LogListener
+from listeners.log import (
+    FSYNC_NONE,
+    FSYNC_POLICIES,
+    EncounterLogListener,
+    LogListener,
+)
+from listeners.queued import BLOCK, OVERFLOW_POLICIES, QueuedListener
 
 DISCOVERY_BACKENDS = {
-    "core": CoreBluetoothDiscovery,
     "nrf": NRFBluetoothDiscovery,
+    "nrf-multi": MultiNRFBluetoothDiscovery,
     "csv": CSVDiscovery,
+    "binary": EncounterLogDiscovery,
+    "pcap": PcapDiscovery,
 }
 
+try:
+    from bluetooth.discovery.core_bluetooth import CoreBluetoothDiscovery
+
+    DISCOVERY_BACKENDS["core"] = CoreBluetoothDiscovery
+except ImportError:
+    # CoreBluetooth is only available on macOS
+    pass
+
+# backends reading encounters_log
+CSV_BACKENDS = [CSVDiscovery]
+
+try:
+    from bluetooth.discovery.csv_chunks import ChunkedCSVDiscovery
+
+    DISCOVERY_BACKENDS["csv-chunked"] = ChunkedCSVDiscovery
+    CSV_BACKENDS.append(ChunkedCSVDiscovery)
+except ImportError:
+    # NumPy is optional
+    pass
+
+try:
+    from listeners.exposure import ExposureListener
+except ImportError:
+    # matching exposure keys needs NumPy and cryptography
+    ExposureListener = None
+
 LISTENERS = {
     "list": CursesDisplayDevicesListener,
     "link": LinkDevicesListener,
@@ -48,29 +88,219 @@ LISTENERS = {
     help="File to log encounters to/read from in csv discovery mode",
     prompt=False,
 )
-def run_discovery(backend, listener, devices_log, encounters_log):
+@click.option(
+    "--binary_log",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Binary encounters log to log encounters to/read from in binary discovery mode",
+    prompt=False,
+)
+@click.option(
+    "--sniffer_port",
+    multiple=True,
+    help="Serial port (or pyserial URL like replay://capture.slip) of nRF sniffer, can be repeated for nrf-multi",
+    prompt=False,
+)
+@click.option(
+    "--replay_speed",
+    type=float,
+    default=0,
+    help="Speed of replaying encounters log in csv discovery mode: 1 real time, N N times faster, 0 as fast as possible",
+    prompt=False,
+)
+@click.option(
+    "--exit_at_eof",
+    is_flag=True,
+    default=False,
+    help="Exit at the end of encounters log in csv discovery mode instead of waiting to be terminated",
+    prompt=False,
+)
+@click.option(
+    "--capture_file",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="nRF Sniffer capture (pcap) file to read from in pcap discovery mode",
+    prompt=False,
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of processes decoding capture file in pcap discovery mode",
+    prompt=False,
+)
+@click.option(
+    "--queue_size",
+    type=int,
+    default=0,
+    help="Pass encounters to each listener from its own thread through queue of this size (0 to call listeners directly)",
+    prompt=False,
+)
+@click.option(
+    "--overflow",
+    type=click.Choice(OVERFLOW_POLICIES),
+    default=BLOCK,
+    help="What to do with new encounter when listener queue is full",
+    prompt=False,
+)
+@click.option(
+    "--device_ttl",
+    type=int,
+    default=0,
+    help="Forget devices not seen for this many seconds (0 to keep them forever)",
+    prompt=False,
+)
+@click.option(
+    "--summaries_log",
+    type=click.File("a"),
+    default=None,
+    help="File to log summaries of forgotten devices to",
+    prompt=False,
+)
+@click.option(
+    "--exposure_keys",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help="Exposure keys export (zip or export.bin) to match seen devices against, can be repeated",
+    prompt=False,
+)
+@click.option(
+    "--flush_interval",
+    type=float,
+    default=1.0,
+    help="How often (in seconds) buffered logs are written to files",
+    prompt=False,
+)
+@click.option(
+    "--fsync",
+    type=click.Choice(FSYNC_POLICIES),
+    default=FSYNC_NONE,
+    help="When logs are synced to the disk: never explicitly, with every flush or after every write (line or batch of encounters)",
+    prompt=False,
+)
+def run_discovery(
+    backend,
+    listener,
+    devices_log,
+    encounters_log,
+    binary_log,
+    sniffer_port,
+    replay_speed,
+    exit_at_eof,
+    capture_file,
+    workers,
+    queue_size,
+    overflow,
+    device_ttl,
+    summaries_log,
+    exposure_keys,
+    flush_interval,
+    fsync,
+):
     backend_class = DISCOVERY_BACKENDS[backend]
     listener_class = LISTENERS[listener]
-    listeners = [listener_class()]
+    expiry_options = {
+        "device_ttl": timedelta(seconds=device_ttl) if device_ttl else None,
+        "on_evict": (
+            (lambda summary: summaries_log.write(summary.to_csv()))
+            if summaries_log
+            else None
+        ),
+    }
+    listeners = [listener_class(**expiry_options)]
 
-    if devices_log or encounters_log and not backend_class == CSVDiscovery:
+    if devices_log or encounters_log and backend_class not in CSV_BACKENDS:
         listeners.append(
-            LogListener(devices_log=devices_log, encounters_log=encounters_log)
+            LogListener(
+                devices_log=devices_log,
+                # in csv discovery mode encounters are read from this file
+                encounters_log=(
+                    None if backend_class in CSV_BACKENDS else encounters_log
+                ),
+                flush_interval=flush_interval,
+                fsync=fsync,
+                # summaries of evicted devices are written by the main listener only
+                device_ttl=expiry_options["device_ttl"],
+            )
         )
 
+    if binary_log and backend_class != EncounterLogDiscovery:
+        listeners.append(
+            EncounterLogListener(
+                binary_log=open(binary_log, "ab"), flush_interval=flush_interval
+            )
+        )
+
+    if exposure_keys:
+        if ExposureListener is None:
+            raise ValueError("matching exposure keys needs numpy and cryptography")
+        listeners.append(
+            ExposureListener(
+                exports=[stream_keys_from_file(export) for export in exposure_keys]
+            )
+        )
+
+    if queue_size:
+        listeners = [
+            QueuedListener(listener, max_size=queue_size, overflow=overflow)
+            for listener in listeners
+        ]
+
     if backend_class == CSVDiscovery:
+        if not encounters_log:
+            raise ValueError("csv discovery backend needs encounters_log to read from")
+        bluetooth_discovery = backend_class(
+            listeners=listeners,
+            encounters_log=encounters_log,
+            speed=replay_speed,
+            exit_at_eof=exit_at_eof,
+        )
+    elif backend_class in CSV_BACKENDS:
         if not encounters_log:
             raise ValueError("csv discovery backend needs encounters_log to read from")
         bluetooth_discovery = backend_class(
             listeners=listeners, encounters_log=encounters_log
         )
+    elif backend_class == EncounterLogDiscovery:
+        if not binary_log:
+            raise ValueError("binary discovery backend needs binary_log to read from")
+        bluetooth_discovery = backend_class(
+            listeners=listeners, binary_log=open(binary_log, "rb")
+        )
+    elif backend_class == PcapDiscovery:
+        if not capture_file:
+            raise ValueError("pcap discovery backend needs capture_file to read from")
+        bluetooth_discovery = backend_class(
+            listeners=listeners, capture_file=capture_file, workers=workers
+        )
+    elif backend_class == NRFBluetoothDiscovery:
+        bluetooth_discovery = backend_class(
+            listeners=listeners, interface=sniffer_port[0] if sniffer_port else None
+        )
+    elif backend_class == MultiNRFBluetoothDiscovery:
+        bluetooth_discovery = backend_class(
+            listeners=listeners, interfaces=list(sniffer_port) or None
+        )
     else:
         bluetooth_discovery = backend_class(listeners=listeners)
 
+    # make sure listeners get cleaned up (and logs flushed) when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     try:
         bluetooth_discovery.start()
     finally:
         bluetooth_discovery.cleanup()
+        for listener in listeners:
+            if isinstance(listener, QueuedListener):
+                print(listener.stats())
+                listener = listener.listener
+            if device_ttl and hasattr(listener, "device_stats"):
+                print(listener.device_stats())
+            if exposure_keys and isinstance(listener, ExposureListener):
+                print(listener.stats())
+            if isinstance(listener, LogListener):
+                for stats in listener.log_stats():
+                    print(stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+"""
+Encounters with random devices and times, as they would be logged
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from bluetooth.discovery import csv
+from bluetooth.discovery.data import Encounter
+
+
+def random_encounters(count: int, seed: int = 0):
+    random.seed(seed)
+    devices = [
+        (f"{device:012x}", bytes(random.randrange(256) for _ in range(20)).hex())
+        for device in range(30)
+    ]
+    time = datetime(2020, 7, 1)
+    encounters = []
+    for _ in range(count):
+        # whole seconds are logged without microseconds by isoformat
+        time += timedelta(microseconds=random.choice([0, 1, 999_999, 1_000_000]))
+        device_key, service_data = random.choice(devices)
+        encounters.append(
+            Encounter(device_key, service_data, time, random.randint(-128, 127))
+        )
+    return encounters
+
+
+def to_csv(encounters) -> str:
+    return "".join(csv.encounter_to_csv(encounter) for encounter in encounters)
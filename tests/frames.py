@@ -0,0 +1,62 @@
+"""
+nRF Sniffer frames with Exposure Notification advertisements, as the firmware (protocol version 2) sends them
+"""
+
+from typing import List, Tuple
+
+from SnifferAPI import Packet
+
+ACCESS_ADDRESS = bytes([0xD6, 0xBE, 0x89, 0x8E])
+# flags, EN service UUID and header of EN service data (RPI + AEM follow)
+EN_ADVERTISING_DATA = bytes.fromhex("020106" "03036ffd" "17166ffd")
+EN_SERVICE_DATA_LENGTH = 20
+CRC = bytes(3)
+
+
+def en_frame(
+    counter: int,
+    timestamp: int,
+    address: bytes,
+    service_data: bytes,
+    rssi: int = -60,
+    channel: int = 37,
+) -> bytes:
+    """
+    Decoded (not SLIP encoded) EVENT_PACKET frame, timestamp is in microseconds
+    """
+    payload = bytes(reversed(address)) + EN_ADVERTISING_DATA + service_data + CRC
+    # ADV_NONCONN_IND with random address
+    ble_packet = ACCESS_ADDRESS + bytes([0x42, len(payload), 0]) + payload
+    header = (
+        bytes([10, 1, channel, -rssi])
+        + (counter % Packet.PACKET_COUNTER_CAP).to_bytes(2, "little")
+        + (timestamp % 2**32).to_bytes(4, "little")
+    )
+    body = header + ble_packet
+    return (
+        len(body).to_bytes(2, "little")
+        + bytes([Packet.PROTOVER_V2])
+        + (counter % Packet.PACKET_COUNTER_CAP).to_bytes(2, "little")
+        + bytes([Packet.EVENT_PACKET])
+        + body
+    )
+
+
+def en_frames(count: int, devices: int = 5) -> List[Tuple[bytes, bytes, int]]:
+    """
+    (frame, device address, rssi) of count frames 2 ms apart, taking turns of devices
+    """
+    frames = []
+    for counter in range(count):
+        device = counter % devices
+        address = bytes([0xC0, 0, 0, 0, 0, device])
+        # service data contains SLIP special bytes, so escaping is exercised too
+        service_data = bytes([0xAB, 0xBC, 0xCD, device]) + bytes(
+            range(EN_SERVICE_DATA_LENGTH - 4)
+        )
+        rssi = -40 - counter % 50
+        frame = en_frame(
+            counter, counter * 2000, address, service_data, rssi, 37 + counter % 3
+        )
+        frames.append((frame, address, rssi))
+    return frames
@@ -0,0 +1,46 @@
+"""
+Exposure keys and exports for tests
+"""
+
+import random
+import zipfile
+
+from decode_keys import EXPORT_FILE, EXPORT_HEADER
+from exposure_keys.keys_pb2 import TemporaryExposureKey, TemporaryExposureKeyExport
+
+# Exposure Notification Cryptography test vector
+TEST_TEK = bytes.fromhex("75c734c6dd1a782de7a965da5eb93125")
+TEST_RPIK = bytes.fromhex("185ad91db69ec7dd048960f1f3ba6175")
+TEST_INTERVAL = 2642976
+TEST_RPI = bytes.fromhex("8be6cd371c5c891604bfbe49df845096")
+
+
+def random_keys(count: int, seed: int = 0):
+    random.seed(seed)
+    keys = []
+    for index in range(count):
+        key = TemporaryExposureKey()
+        key.key_data = bytes(random.randrange(256) for _ in range(16))
+        key.rolling_start_interval_number = TEST_INTERVAL - 144 * (index % 14)
+        key.rolling_period = random.choice([144, 72, 1])
+        keys.append(key)
+    return keys
+
+
+def export_with_keys(keys) -> TemporaryExposureKeyExport:
+    export = TemporaryExposureKeyExport()
+    export.start_timestamp = 1591142400
+    export.region = "CZ"
+    export.keys.extend(keys)
+    return export
+
+
+def write_export(path, keys, zipped: bool = False) -> str:
+    data = EXPORT_HEADER + export_with_keys(keys).SerializeToString()
+    if zipped:
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(EXPORT_FILE, data)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    return str(path)
@@ -0,0 +1,53 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bluetooth.discovery.base import EncounterBatcher
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+
+START = datetime(2020, 7, 1, 12)
+
+
+class SlowListener(EncounterListener):
+    def __init__(self) -> None:
+        self.batches = []
+        self.release = threading.Event()
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        pass
+
+    def new_encounters(self, encounters) -> None:
+        self.release.wait(5)
+        self.batches.append(encounters)
+
+
+def encounter(second: int) -> Encounter:
+    return Encounter("aa", "bb", START + timedelta(seconds=second), -50)
+
+
+def test_adding_does_not_wait_for_listeners():
+    listener = SlowListener()
+    batcher = EncounterBatcher([listener], max_size=1000, max_delay=0.02)
+    batcher.add(encounter(0))
+    # flusher thread took the batch and waits in the listener
+    time.sleep(0.2)
+    started = time.monotonic()
+    for second in range(1, 100):
+        batcher.add(encounter(second))
+    assert time.monotonic() - started < 1
+    listener.release.set()
+    batcher.close()
+    received = [encounter for batch in listener.batches for encounter in batch]
+    assert received == [encounter(second) for second in range(100)]
+
+
+def test_batches_keep_order():
+    listener = SlowListener()
+    listener.release.set()
+    batcher = EncounterBatcher([listener], max_size=7, max_delay=0.001)
+    for second in range(2000):
+        batcher.add(encounter(second))
+    batcher.close()
+    received = [encounter for batch in listener.batches for encounter in batch]
+    assert received == [encounter(second) for second in range(2000)]
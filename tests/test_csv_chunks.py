@@ -0,0 +1,106 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from bluetooth.discovery import csv
+from bluetooth.discovery.csv_chunks import (
+    ChunkedCSVDiscovery,
+    DeviceCodes,
+    parse_chunk,
+    read_chunks,
+)
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+from tests.encounters import random_encounters, to_csv
+
+
+class CollectingListener(EncounterListener):
+    def __init__(self) -> None:
+        self.encounters = []
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        self.encounters.append(encounter)
+
+
+class ColumnsListener(CollectingListener):
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks = []
+
+    def new_encounter_columns(self, columns) -> None:
+        self.chunks.append(columns)
+
+
+def read_chunked(data: str, chunk_size: int):
+    listener = CollectingListener()
+    ChunkedCSVDiscovery(
+        [listener], io.BytesIO(data.encode("utf-8")), chunk_size=chunk_size
+    ).start()
+    return listener.encounters
+
+
+@pytest.mark.parametrize("chunk_size", [100, 4096, 16 * 1024 * 1024])
+def test_chunked_csv_matches_csv_discovery(chunk_size):
+    data = to_csv(random_encounters(5000))
+    assert read_chunked(data, chunk_size) == list(
+        csv.read_encounters(io.StringIO(data))
+    )
+
+
+def test_chunked_csv_is_parsed_with_numpy():
+    data = to_csv(random_encounters(1000))
+    (chunk,) = read_chunks(io.BytesIO(data.encode("utf-8")))
+    assert len(chunk) == 1000
+    assert chunk.times.dtype.kind == "M"
+
+
+def test_chunked_csv_fallback_keeps_timezone():
+    aware = datetime(2020, 7, 1, 10, tzinfo=timezone(timedelta(hours=2)))
+    data = (
+        f"{aware.isoformat()},aa,bb,-50\n"
+        "\n"
+        '2020-07-01T10:00:01,"a,b",bb,-51\n'
+        f"{(aware + timedelta(seconds=2)).isoformat()},aa,bb,-52"
+    )
+    encounters = read_chunked(data, 4096)
+    assert encounters == list(csv.read_encounters(io.StringIO(data)))
+    assert encounters[0].time == aware
+    assert encounters[0].time.utcoffset() == timedelta(hours=2)
+    assert encounters[1].device_key == "a,b"
+
+
+def test_columns_listener_gets_whole_chunks():
+    data = to_csv(random_encounters(3000))
+    listener = ColumnsListener()
+    ChunkedCSVDiscovery([listener], io.BytesIO(data.encode("utf-8"))).start()
+    (chunk,) = listener.chunks
+    assert len(chunk) == 3000
+    assert listener.encounters == []
+    assert list(chunk.encounters()) == list(csv.read_encounters(io.StringIO(data)))
+
+
+@pytest.mark.parametrize(
+    "time",
+    [
+        "2020-13-01T10:00:00",
+        "2020-00-01T10:00:00",
+        "2020-04-31T10:00:00",
+        "2021-02-29T10:00:00",
+        "2020-07-01T24:00:00",
+        "2020-07-01T10:60:00",
+        "2020-07-01T10:00:60.000000",
+    ],
+)
+def test_chunked_csv_out_of_range_time_falls_back_to_rows(time):
+    data = f"2020-07-01T10:00:00,aa,bb,-50\n{time},aa,bb,-51\n"
+    assert parse_chunk(data.encode("utf-8"), DeviceCodes()) is None
+    # rows are parsed like CSVDiscovery does, which rejects the time
+    with pytest.raises(ValueError):
+        read_chunked(data, 4096)
+
+
+def test_chunked_csv_leap_day():
+    data = "2020-02-29T23:59:59.999999,aa,bb,-50\n"
+    (chunk,) = read_chunks(io.BytesIO(data.encode("utf-8")))
+    assert list(chunk.encounters()) == list(csv.read_encounters(io.StringIO(data)))
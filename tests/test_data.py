@@ -0,0 +1,51 @@
+import random
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+
+from listeners.data import Device, Read
+
+START = datetime(2020, 7, 1, 12)
+
+
+def test_device_statistics():
+    random.seed(0)
+    for count in range(1, 50):
+        seen = START
+        reads = []
+        for _ in range(count):
+            seen += timedelta(milliseconds=random.randint(10, 900))
+            reads.append(Read(time=seen, rssi=random.randint(-100, -30)))
+        device = Device(key="aa", service_data="bb", reads=reads)
+        # gaps are kept in whole milliseconds
+        gaps = [
+            (later.time - earlier.time) // timedelta(milliseconds=1)
+            for earlier, later in zip(reads, reads[1:])
+        ]
+        assert device.time_between == (int(statistics.median(gaps)) if gaps else 0)
+        assert list(device.reads) == reads
+        assert device.presence == reads[-1].time - reads[0].time
+        rssis = [read.rssi for read in reads]
+        assert device.first_average_rssi == int(sum(rssis[:5]) / len(rssis[:5]))
+        assert device.last_average_rssi == int(sum(rssis[-5:]) / len(rssis[-5:]))
+
+
+def test_device_memory_per_read():
+    random.seed(1)
+    reads_count = 20000
+
+    def reads():
+        seen = START
+        for _ in range(reads_count):
+            seen += timedelta(milliseconds=random.randint(200, 300))
+            yield Read(time=seen, rssi=random.randint(-100, -30))
+
+    tracemalloc.start()
+    try:
+        device = Device(key="aa", service_data="bb", reads=reads())
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(device.reads) == reads_count
+    # 8 bytes of time and 1 byte of rssi, gaps take no more than their histogram
+    assert size / reads_count < 12
@@ -0,0 +1,55 @@
+import pytest
+
+from decode_keys import (
+    EXPORT_FILE,
+    EXPORT_HEADER,
+    KEYS_FIELD,
+    decode_key_from_file,
+    export_fields,
+    open_export_file,
+    read_export_header,
+    stream_keys_from_file,
+)
+from exposure_keys.keys_pb2 import TemporaryExposureKey
+from tests.keys import export_with_keys, random_keys, write_export
+
+
+@pytest.mark.parametrize("zipped", [False, True])
+def test_streamed_keys_match_parsed_export(tmp_path, zipped):
+    keys = random_keys(1000)
+    export = write_export(tmp_path / "export.zip", keys, zipped=zipped)
+    streamed = list(stream_keys_from_file(export))
+    assert streamed == list(decode_key_from_file(export).keys)
+    assert streamed == keys
+
+
+def test_export_fields_in_small_chunks(tmp_path):
+    keys = random_keys(50)
+    export = write_export(tmp_path / "export.bin", keys)
+    with open_export_file(export, EXPORT_FILE) as f:
+        read_export_header(f)
+        fields = list(export_fields(f, chunk_size=7))
+    assert [
+        TemporaryExposureKey.FromString(payload)
+        for field_number, payload in fields
+        if field_number == KEYS_FIELD
+    ] == keys
+    # start_timestamp and region
+    assert len(fields) == len(keys) + 2
+
+
+def test_export_header_is_checked(tmp_path):
+    path = tmp_path / "export.bin"
+    path.write_bytes(b"EK Export v2    " + export_with_keys([]).SerializeToString())
+    with pytest.raises(ValueError):
+        list(stream_keys_from_file(str(path)))
+    with pytest.raises(ValueError):
+        decode_key_from_file(str(path))
+
+
+def test_truncated_export(tmp_path):
+    path = tmp_path / "export.bin"
+    data = EXPORT_HEADER + export_with_keys(random_keys(3)).SerializeToString()
+    path.write_bytes(data[:-5])
+    with pytest.raises(ValueError):
+        list(stream_keys_from_file(str(path)))
@@ -0,0 +1,114 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from bluetooth.discovery import csv, encounter_log
+from bluetooth.discovery.data import Encounter
+from tests.encounters import random_encounters, to_csv
+
+
+def write_log(log, encounters, block_records=encounter_log.BLOCK_RECORDS):
+    writer = encounter_log.EncounterLogWriter(log, block_records=block_records)
+    for encounter in encounters:
+        writer.write(encounter)
+    writer.flush()
+
+
+def test_binary_log_round_trip():
+    encounters = random_encounters(10000)
+    log = io.BytesIO()
+    writer = encounter_log.EncounterLogWriter(log, block_records=1000)
+    for encounter in csv.read_encounters(io.StringIO(to_csv(encounters))):
+        writer.write(encounter)
+    writer.flush()
+
+    log.seek(0)
+    decoded = list(encounter_log.read_encounters(log))
+    assert decoded == encounters
+    assert to_csv(decoded) == to_csv(encounters)
+
+
+def test_binary_log_appended_segments_and_large_gaps():
+    encounters = random_encounters(10)
+    # gap which does not fit into int32 microseconds delta
+    late = Encounter("late", "", encounters[-1].time + timedelta(hours=1), -50)
+    log = io.BytesIO()
+    for part in (encounters[:5], encounters[5:] + [late]):
+        writer = encounter_log.EncounterLogWriter(log)
+        for encounter in part:
+            writer.write(encounter)
+        writer.flush()
+
+    log.seek(0)
+    assert list(encounter_log.read_encounters(log)) == encounters + [late]
+
+
+def test_binary_log_ignores_incomplete_block():
+    log = io.BytesIO()
+    writer = encounter_log.EncounterLogWriter(log)
+    for encounter in random_encounters(100):
+        writer.write(encounter)
+    writer.flush()
+    data = log.getvalue()
+    assert list(encounter_log.read_encounters(io.BytesIO(data[:-1]))) == []
+
+
+def test_binary_log_resyncs_after_truncated_block():
+    encounters = random_encounters(300)
+    log = io.BytesIO()
+    write_log(log, encounters[:200], block_records=100)
+    # the second block was cut short, then the log was appended to
+    log.truncate(len(log.getvalue()) - 50)
+    log.seek(0, io.SEEK_END)
+    write_log(log, encounters[200:])
+    log.seek(0)
+    assert list(encounter_log.read_encounters(log)) == (
+        encounters[:100] + encounters[200:]
+    )
+
+
+def test_binary_log_long_device_fields():
+    long = Encounter("a" * 300, "b" * 70000, datetime(2020, 7, 1), -50)
+    encounters = [Encounter("a" * 300, "bb", datetime(2020, 7, 1), -50)]
+    log = io.BytesIO()
+    writer = encounter_log.EncounterLogWriter(log)
+    writer.write(encounters[0])
+    with pytest.raises(ValueError):
+        writer.write(long)
+    writer.flush()
+    log.seek(0)
+    assert list(encounter_log.read_encounters(log)) == encounters
+
+
+def test_binary_log_keeps_utc_offsets():
+    naive = datetime(2020, 7, 1, 12)
+    encounters = [
+        Encounter("aa", "bb", naive, -50),
+        Encounter("aa", "bb", naive.replace(tzinfo=timezone.utc), -51),
+        Encounter("aa", "bb", naive.replace(tzinfo=timezone(timedelta(hours=2))), -52),
+        Encounter("cc", "bb", naive + timedelta(seconds=1), -53),
+    ]
+    log = io.BytesIO()
+    write_log(log, encounters)
+    log.seek(0)
+    decoded = list(encounter_log.read_encounters(log))
+    assert decoded == encounters
+    assert [encounter.time.utcoffset() for encounter in decoded] == [
+        None,
+        timedelta(0),
+        timedelta(hours=2),
+        None,
+    ]
+
+
+def test_binary_log_columns():
+    encounters = random_encounters(5000)
+    log = io.BytesIO()
+    write_log(log, encounters, block_records=1000)
+    log.seek(0)
+    chunks = list(encounter_log.read_columns(log))
+    assert [len(chunk) for chunk in chunks] == [1000] * 5
+    assert [
+        encounter for chunk in chunks for encounter in chunk.encounters()
+    ] == encounters
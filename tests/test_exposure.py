@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from bluetooth.discovery.data import Encounter
+from exposure_keys.index import RPIHashIndex
+from exposure_keys.keys_pb2 import TemporaryExposureKey
+from exposure_keys.rpi import derive_rpis, interval_number
+from listeners.exposure import ExposureListener
+from tests.keys import TEST_RPI, random_keys
+
+START = datetime(2020, 7, 1, 12)
+
+
+def test_exposure_listener_matches_broadcasted_rpi():
+    key = TemporaryExposureKey(
+        key_data=bytes(range(16)),
+        rolling_start_interval_number=interval_number(START) - 10,
+    )
+    rpis = derive_rpis([key])
+    row = 10
+    rpi = rpis["rpi"][row].tobytes().hex()
+    matches = []
+    listener = ExposureListener(exports=[[], iter([key])], on_match=matches.append)
+    seen = [
+        Encounter("aa", rpi + "00000000", START + timedelta(seconds=second), -60)
+        for second in range(0, 60, 5)
+    ]
+    # same RPI broadcasted a day later is not accepted
+    seen.append(Encounter("bb", rpi, START + timedelta(days=1), -60))
+    seen.append(Encounter("cc", "not hex", START + timedelta(days=1), -60))
+    listener.new_encounters(seen)
+    listener.cleanup()
+
+    (match,) = matches
+    assert (match.export, match.key_index) == (1, 0)
+    assert match.interval_number == rpis["interval_number"][row]
+    assert match.device.reads == 12
+    assert match.duration == timedelta(seconds=55)
+    assert listener.stats()["matched_encounters"] == 12
+    assert listener.device_stats()["devices"] == 0
+
+
+def test_hash_index():
+    rpis = derive_rpis(random_keys(100))
+    index = RPIHashIndex(rpis)
+    assert len(index) == len(rpis)
+    for row in range(0, len(rpis), 7):
+        assert index.find(rpis["rpi"][row].tobytes()) == row
+    assert index.find(bytes(16)) is None
+    assert index.find(b"short") is None
+    assert RPIHashIndex(derive_rpis([])).find(TEST_RPI) is None
@@ -0,0 +1,31 @@
+from decode_keys import stream_keys_from_file
+from exposure_keys.index import RPIFileIndex, content_hash
+from exposure_keys.rpi import derive_rpis
+from tests.keys import random_keys, write_export
+
+
+def test_file_index(tmp_path):
+    index_dir = str(tmp_path / "index")
+    keys = {"first": random_keys(50, seed=1), "second": random_keys(50, seed=2)}
+    index = RPIFileIndex(index_dir)
+    for batch, batch_keys in keys.items():
+        export = write_export(tmp_path / f"{batch}.bin", batch_keys)
+        index.add(batch, stream_keys_from_file(export), sha256=content_hash(export))
+    assert index.batches == ["first", "second"]
+
+    index = RPIFileIndex(index_dir)
+    assert index.is_current("first", content_hash(str(tmp_path / "first.bin")))
+    assert not index.is_current("first", "0" * 64)
+    assert not index.is_current("third", "0" * 64)
+    for batch, batch_keys in keys.items():
+        rpis = derive_rpis(batch_keys)
+        for row in range(0, len(rpis), 11):
+            source = index.find(rpis["rpi"][row].tobytes())
+            assert source == (
+                batch,
+                rpis["key_index"][row],
+                rpis["interval_number"][row],
+            )
+    assert index.find(bytes(16)) is None
+    assert len(index) == sum(len(derive_rpis(k)) for k in keys.values())
+    index.close()
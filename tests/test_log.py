@@ -0,0 +1,28 @@
+import os
+
+from listeners.log import FSYNC_ALWAYS, LogWriter
+
+
+def test_log_writer_counts_encoded_bytes(tmp_path):
+    path = tmp_path / "log.csv"
+    with open(path, "w", encoding="utf-8") as f:
+        writer = LogWriter(f, buffer_size=10)
+        writer.write("aa,žluťoučký kůň\n")
+        writer.write("bb\n")
+        writer.close()
+    stats = writer.stats()
+    assert stats["lines"] == 2
+    assert stats["bytes"] == path.stat().st_size
+    assert stats["flushes"] == 2
+
+
+def test_log_writer_fsyncs_every_write(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+    with open(tmp_path / "log.csv", "w") as f:
+        writer = LogWriter(f, fsync=FSYNC_ALWAYS)
+        writer.write("aa\n")
+        writer.write("bb\ncc\n", lines=2)
+        assert len(synced) == 2
+        writer.close()
+    assert writer.stats()["lines"] == 3
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from bluetooth.discovery.data import Encounter
+from bluetooth.discovery.nrf import MultiNRFBluetoothDiscovery
+
+
+class CollectingBatcher:
+    def __init__(self) -> None:
+        self.encounters = []
+
+    def add(self, encounter: Encounter) -> None:
+        self.encounters.append(encounter)
+
+
+def test_multi_sniffer_duplicates_are_emitted_once():
+    discovery = MultiNRFBluetoothDiscovery(listeners=[])
+    discovery.batcher = CollectingBatcher()
+    start = datetime(2020, 7, 1)
+    for event in range(10000):
+        time = start + timedelta(milliseconds=event)
+        device = f"{event % 100:012x}"
+        # the same advertising event seen on the other channels few ms later
+        for channel_delay in range(3):
+            discovery.emit(
+                Encounter(device, "", time + timedelta(milliseconds=channel_delay), -60)
+            )
+    assert len(discovery.batcher.encounters) == 10000
+    assert discovery.duplicates_count == 20000
+    # only devices seen within the duplicate window are kept
+    assert len(discovery.last_seen) <= 25
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+
+from SnifferAPI import Packet
+from SnifferAPI.CaptureFiles import CaptureFileHandler
+from bluetooth.discovery.pcap import PcapDiscovery
+from listeners.base import EncounterListener
+from tests.frames import en_frames
+
+START = 1593561600.0
+
+
+class CollectingListener(EncounterListener):
+    def __init__(self) -> None:
+        self.encounters = []
+
+    def new_encounter(self, encounter) -> None:
+        self.encounters.append(encounter)
+
+
+@pytest.fixture
+def capture(tmp_path):
+    frames = en_frames(1000)
+    capture_file = str(tmp_path / "capture.pcap")
+    handler = CaptureFileHandler(capture_file, clear=True)
+    for number, (frame, _, _) in enumerate(frames):
+        packet = Packet.Packet(frame)
+        packet.boardId = 1
+        packet.time = START + number * 0.002
+        handler.writePacket(packet)
+    # a packet which is not EN advertisement is skipped
+    ping = Packet.Packet(
+        bytes([2, 0, Packet.PROTOVER_V2, 0, 0, Packet.PING_RESP, 1, 0])
+    )
+    ping.boardId = 1
+    ping.time = START
+    handler.writePacket(ping)
+    handler.close()
+    return capture_file, frames
+
+
+def read_capture(capture_file: str, workers: int):
+    listener = CollectingListener()
+    PcapDiscovery([listener], capture_file, workers=workers).start()
+    return listener.encounters
+
+
+def test_pcap_encounters(capture):
+    capture_file, frames = capture
+    encounters = read_capture(capture_file, workers=1)
+    assert len(encounters) == len(frames)
+    for number, (encounter, (_, address, rssi)) in enumerate(zip(encounters, frames)):
+        assert encounter.device_key == address.hex()
+        assert encounter.rssi == rssi
+        assert encounter.service_data.startswith("abbccd")
+        expected = datetime.fromtimestamp(START + number * 0.002)
+        assert abs((encounter.time - expected).total_seconds()) < 1e-5
+
+
+def test_pcap_workers_match_single_process(capture):
+    capture_file, _ = capture
+    assert read_capture(capture_file, workers=3) == read_capture(
+        capture_file, workers=1
+    )
+
+
+def test_pcap_ignores_incomplete_last_record(capture):
+    capture_file, frames = capture
+    with open(capture_file, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    assert len(read_capture(capture_file, workers=1)) == len(frames)
+    assert len(read_capture(capture_file, workers=3)) == len(frames)
@@ -0,0 +1,57 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from bluetooth.discovery.data import Encounter
+from listeners.base import EncounterListener
+from listeners.queued import DROP_NEWEST, QueuedListener
+
+START = datetime(2020, 7, 1, 12)
+
+
+class FailingListener(EncounterListener):
+    """
+    Fails whole batch when it contains encounter with rssi 0
+    """
+
+    def __init__(self) -> None:
+        self.encounters = []
+
+    def new_encounter(self, encounter: Encounter) -> None:
+        if encounter.rssi == 0:
+            raise RuntimeError("bad encounter")
+        self.encounters.append(encounter)
+
+
+def encounters(rssis):
+    return [
+        Encounter("aa", "bb", START + timedelta(seconds=second), rssi)
+        for second, rssi in enumerate(rssis)
+    ]
+
+
+def test_queued_listener_counts_failed_encounters(caplog):
+    listener = FailingListener()
+    queued = QueuedListener(listener)
+    with caplog.at_level(logging.CRITICAL):
+        # every batch is taken by the worker at once, so it fails or passes as a whole
+        for batch in ([-50, -51], [-52, 0, -53], [-54]):
+            queued.new_encounters(encounters(batch))
+            while queued.queue_depth:
+                time.sleep(0.001)
+        queued.cleanup()
+    stats = queued.stats()
+    assert (stats["received"], stats["processed"], stats["errors"]) == (6, 3, 3)
+    assert [encounter.rssi for encounter in listener.encounters] == [-50, -51, -52, -54]
+
+
+def test_queued_listener_drops_newest():
+    listener = FailingListener()
+    queued = QueuedListener(listener, max_size=1, overflow=DROP_NEWEST)
+    with queued.lock:
+        # worker can not take anything while the lock is held
+        for encounter in encounters([-50, -51, -52]):
+            queued.put(encounter)
+    queued.cleanup()
+    assert queued.stats()["dropped"] == 2
+    assert listener.encounters == encounters([-50])
@@ -0,0 +1,62 @@
+import pytest
+import serial
+
+from SnifferAPI import Packet
+from SnifferAPI.protocol_replay import _encodeFrame
+from tests.frames import en_frames
+
+
+@pytest.fixture
+def stream_file(tmp_path):
+    frames = [frame for frame, _, _ in en_frames(500)]
+    path = tmp_path / "stream.slip"
+    path.write_bytes(b"".join(_encodeFrame(frame) for frame in frames))
+    return path, frames
+
+
+def read_frames(port, count):
+    decoder = Packet.SlipDecoder()
+    frames = []
+    while len(frames) < count:
+        frames += decoder.feed(port.read(4096))
+    return frames
+
+
+def test_replay_stream(stream_file):
+    path, frames = stream_file
+    port = serial.serial_for_url(f"replay://{path}?speed=0", timeout=5)
+    try:
+        assert read_frames(port, len(frames)) == frames
+        with pytest.raises(serial.SerialException):
+            port.read(1)
+    finally:
+        port.close()
+
+
+def test_replay_loop(stream_file):
+    path, frames = stream_file
+    port = serial.serial_for_url(f"replay://{path}?speed=0&loop=1", timeout=5)
+    try:
+        assert read_frames(port, 3 * len(frames))[: 3 * len(frames)] == 3 * frames
+    finally:
+        port.close()
+
+
+def test_replay_answers_ping(stream_file):
+    path, frames = stream_file
+    port = serial.serial_for_url(f"replay://{path}?speed=0", timeout=5)
+    try:
+        ping = [0, 0, Packet.PROTOVER_V2, 0, 0, Packet.PING_REQ]
+        port.write(bytes(Packet.PacketReader.encodeToSLIP(None, ping)))
+        packets = [Packet.Packet(frame) for frame in read_frames(port, len(frames) + 1)]
+        (response,) = [packet for packet in packets if packet.id == Packet.PING_RESP]
+        assert response.version == 1111
+    finally:
+        port.close()
+
+
+def test_replay_url_options(tmp_path):
+    with pytest.raises(serial.SerialException):
+        serial.serial_for_url(f"replay://{tmp_path}/missing.slip")
+    with pytest.raises(serial.SerialException):
+        serial.serial_for_url(f"replay://{tmp_path}/stream.slip?speed=-1")
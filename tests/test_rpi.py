@@ -0,0 +1,63 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from exposure_keys.keys_pb2 import TemporaryExposureKey
+from exposure_keys.rpi import (
+    RPI_DTYPE,
+    derive_rpik,
+    derive_rpis,
+    derive_rpis_sharded,
+    interval_number,
+    load_rpis,
+)
+from tests.keys import TEST_INTERVAL, TEST_RPI, TEST_RPIK, TEST_TEK, random_keys
+
+
+def test_rpik_test_vector():
+    assert derive_rpik(TEST_TEK) == TEST_RPIK
+
+
+def test_rpi_test_vector():
+    key = TemporaryExposureKey(
+        key_data=TEST_TEK, rolling_start_interval_number=TEST_INTERVAL
+    )
+    rpis = derive_rpis([key])
+    assert len(rpis) == 144
+    assert rpis["rpi"][0].tobytes() == TEST_RPI
+    assert list(rpis["interval_number"]) == list(
+        range(TEST_INTERVAL, TEST_INTERVAL + 144)
+    )
+    assert not rpis["key_index"].any()
+
+
+def test_interval_number():
+    time = datetime.fromtimestamp(TEST_INTERVAL * 600 + 599, tz=timezone.utc)
+    assert interval_number(time) == TEST_INTERVAL
+    assert interval_number(time.astimezone().replace(tzinfo=None)) == TEST_INTERVAL
+
+
+def test_invalid_keys_are_skipped():
+    keys = random_keys(3)
+    keys[1].key_data = b"short"
+    rpis = derive_rpis(keys)
+    last = derive_rpis([keys[2]])
+    last["key_index"] = 2
+    assert np.array_equal(rpis, np.concatenate([derive_rpis([keys[0]]), last]))
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_sharded_derivation_matches_single_process(tmp_path, workers):
+    keys = random_keys(200)
+    rpis = derive_rpis(keys)
+    rpis_file = str(tmp_path / "rpis.npy")
+    stats = derive_rpis_sharded(keys, rpis_file, workers=workers)
+    assert stats["keys"] == 200 and stats["rpis"] == len(rpis)
+    with open(rpis_file, "rb") as f:
+        sharded = load_rpis(f)
+    assert sharded.dtype == RPI_DTYPE
+    expected = rpis[np.argsort(rpis["rpi"].view("S16"), kind="stable")]
+    assert np.array_equal(sharded, expected)
+    assert not os.path.exists(f"{rpis_file}.shards.npy")
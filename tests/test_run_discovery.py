@@ -0,0 +1,103 @@
+import signal
+from datetime import datetime, timedelta
+
+import pytest
+from click.testing import CliRunner
+
+from bluetooth.discovery import csv, encounter_log
+from bluetooth.discovery.data import Encounter
+from run_discovery import run_discovery
+
+
+@pytest.fixture
+def encounters_log(tmp_path):
+    start = datetime(2020, 7, 1, 12)
+    path = tmp_path / "encounters.csv"
+    with open(path, "w") as f:
+        for second in range(300):
+            f.write(
+                csv.encounter_to_csv(
+                    Encounter(
+                        f"{second // 60:012x}",
+                        "00" * 20,
+                        start + timedelta(seconds=second),
+                        -60,
+                    )
+                )
+            )
+    return path
+
+
+@pytest.fixture(autouse=True)
+def sigterm_handler():
+    # run_discovery installs its own handler
+    handler = signal.getsignal(signal.SIGTERM)
+    yield
+    signal.signal(signal.SIGTERM, handler)
+
+
+def test_replay_with_device_ttl_and_binary_log(tmp_path, encounters_log):
+    binary_log = tmp_path / "encounters.bin"
+    result = CliRunner().invoke(
+        run_discovery,
+        [
+            "--backend",
+            "csv",
+            "--encounters_log",
+            str(encounters_log),
+            "--listener",
+            "link",
+            "--exit_at_eof",
+            "--device_ttl",
+            "60",
+            "--binary_log",
+            str(binary_log),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "'evicted'" in result.output
+    with open(encounters_log) as csv_log, open(binary_log, "rb") as f:
+        assert list(encounter_log.read_encounters(f)) == list(
+            csv.read_encounters(csv_log)
+        )
+
+
+def test_summaries_are_written_once(tmp_path):
+    # devices seen far apart, so they are not linked and all but the last one expire
+    start = datetime(2020, 7, 1, 12)
+    encounters_log = tmp_path / "encounters.csv"
+    with open(encounters_log, "w") as f:
+        for device in range(5):
+            for second in range(10):
+                f.write(
+                    csv.encounter_to_csv(
+                        Encounter(
+                            f"{device:012x}",
+                            "00" * 20,
+                            start + timedelta(seconds=device * 100 + second),
+                            -60,
+                        )
+                    )
+                )
+    summaries_log = tmp_path / "summaries.csv"
+    result = CliRunner().invoke(
+        run_discovery,
+        [
+            "--backend",
+            "csv",
+            "--encounters_log",
+            str(encounters_log),
+            "--listener",
+            "link",
+            "--exit_at_eof",
+            "--device_ttl",
+            "60",
+            "--devices_log",
+            str(tmp_path / "devices.csv"),
+            "--summaries_log",
+            str(summaries_log),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    devices = [line.split(",")[0] for line in summaries_log.read_text().splitlines()]
+    assert devices == [f"{device:012x}" for device in range(4)]
@@ -0,0 +1,114 @@
+import random
+
+from SnifferAPI import Packet, UART
+from SnifferAPI.protocol_replay import _encodeFrame
+from tests.frames import en_frames
+
+SLIP_ESCAPES = {
+    Packet.SLIP_ESC_START: Packet.SLIP_START,
+    Packet.SLIP_ESC_END: Packet.SLIP_END,
+    Packet.SLIP_ESC_ESC: Packet.SLIP_ESC,
+}
+
+
+def decode_bytewise(stream: bytes):
+    """
+    Reference byte by byte decoder, as PacketReader used to decode frames
+    """
+    frames = []
+    data = iter(stream)
+    try:
+        while True:
+            while next(data) != Packet.SLIP_START:
+                pass
+            frame = bytearray()
+            while True:
+                byte = next(data)
+                if byte == Packet.SLIP_END:
+                    break
+                if byte == Packet.SLIP_ESC:
+                    byte = SLIP_ESCAPES.get(next(data), Packet.SLIP_END)
+                frame.append(byte)
+            frames.append(bytes(frame))
+    except StopIteration:
+        return frames
+
+
+def feed_in_chunks(stream: bytes, max_chunk: int):
+    decoder = Packet.SlipDecoder()
+    frames = []
+    position = 0
+    while position < len(stream):
+        size = random.randint(1, max_chunk)
+        frames += decoder.feed(stream[position : position + size])
+        position += size
+    return frames
+
+
+def test_encode_decode_round_trip():
+    random.seed(1)
+    special = [Packet.SLIP_START, Packet.SLIP_END, Packet.SLIP_ESC, 0xAC, 0xCE, 0, 7]
+    frames = [
+        bytes(random.choice(special) for _ in range(random.randint(0, 40)))
+        for _ in range(200)
+    ]
+    stream = b"".join(bytes(Packet.PacketReader.encodeToSLIP(None, f)) for f in frames)
+    for max_chunk in (1, 3, 64, len(stream)):
+        assert feed_in_chunks(stream, max_chunk) == frames
+
+
+def test_matches_bytewise_decoder_with_garbage():
+    random.seed(2)
+    noise = [0, 1, Packet.SLIP_START, Packet.SLIP_END, Packet.SLIP_ESC, 5]
+    for _ in range(500):
+        stream = bytearray()
+        for _ in range(random.randint(0, 6)):
+            stream += bytes(random.choice(noise) for _ in range(random.randint(0, 3)))
+            stream += bytes(
+                Packet.PacketReader.encodeToSLIP(
+                    None, [random.choice(noise) for _ in range(random.randint(0, 20))]
+                )
+            )
+        assert feed_in_chunks(bytes(stream), 10) == decode_bytewise(stream)
+
+
+def test_incomplete_frame_is_kept_for_next_chunk():
+    decoder = Packet.SlipDecoder()
+    encoded = bytes(Packet.PacketReader.encodeToSLIP(None, [1, Packet.SLIP_END, 2]))
+    assert decoder.feed(encoded[:-1]) == []
+    assert decoder.feed(encoded[-1:]) == [bytes([1, Packet.SLIP_END, 2])]
+
+
+def test_parse_en_packet():
+    frame, address, rssi = en_frames(3)[2]
+    packet = Packet.Packet(frame)
+    assert packet.valid and packet.OK
+    assert packet.id == Packet.EVENT_PACKET
+    assert packet.RSSI == rssi
+    assert packet.channel == 39
+    assert packet.timestamp == 4000
+    assert bytes(packet.blePacket.advAddress[:6]) == address
+    # BLE padding byte is left out
+    assert len(packet.getBytes()) == len(frame) - 1
+
+
+def test_invalid_packet():
+    assert not Packet.Packet([]).valid
+
+
+def test_uart_reads_bytes_and_chunks(tmp_path):
+    stream = b"".join(_encodeFrame(frame) for frame, _, _ in en_frames(200))
+    path = tmp_path / "stream.slip"
+    path.write_bytes(stream)
+    uart = UART.Uart(f"replay://{path}?speed=0&eof=idle", 1000000)
+    try:
+        data = bytes(uart.readByte(timeout=5) for _ in range(10))
+        while len(data) < len(stream):
+            # mixing single byte reads with chunks must not lose or repeat anything
+            if len(data) % 2:
+                data += bytes([uart.readByte(timeout=5)])
+            else:
+                data += uart.readChunk(timeout=5)
+        assert data == stream
+    finally:
+        uart.close()
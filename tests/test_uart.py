@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+from SnifferAPI import UART
+from SnifferAPI.protocol_replay import FAKE_FIRMWARE_VERSION, _encodeFrame
+from tests.frames import en_frames
+
+
+@pytest.fixture
+def sniffer_port(tmp_path, monkeypatch):
+    path = tmp_path / "stream.slip"
+    path.write_bytes(b"".join(_encodeFrame(frame) for frame, _, _ in en_frames(50)))
+    port = f"replay://{path}?speed=0&loop=1"
+    monkeypatch.setattr(
+        UART.list_ports, "comports", lambda: [SimpleNamespace(device=port)]
+    )
+    written = []
+    monkeypatch.setattr(
+        UART, "_write_sniffer_cache", lambda *cache: written.append(cache)
+    )
+    return port, written
+
+
+def test_first_sniffer_version_is_asked_for_after_listening(sniffer_port):
+    port, written = sniffer_port
+    result = UART.find_first_sniffer(use_cache=False)
+    assert result["port"] == port
+    assert result["version"] == FAKE_FIRMWARE_VERSION
+    assert written == [(port, result["default"], FAKE_FIRMWARE_VERSION)]
+
+
+def test_cached_version_is_reused(sniffer_port, monkeypatch):
+    port, written = sniffer_port
+    monkeypatch.setattr(
+        UART, "_read_sniffer_cache", lambda: (port, UART.SNIFFER_BAUDRATES[0], 42)
+    )
+    result = UART.find_first_sniffer()
+    assert (result["default"], result["version"]) == (UART.SNIFFER_BAUDRATES[0], 42)
+    # nothing changed, so the cache is not rewritten
+    assert written == []